@@ -1,24 +1,61 @@
-from solarpanel.data_processing import get_google_data, gsheet2df
-from solarpanel.data_visualization import dash_test1
+import gc
 import dash
-import pandas as pd
+from flask import jsonify
+from solarpanel.sites import SiteLoader, build_profiles, load_profiles, load_sites
+from solarpanel.data_visualization import dash_test1
+from solarpanel import metrics
 import settings
 
-if __name__ == '__main__':
+external_stylesheets = ['https://codepen.io/meganb/pen/YzzwWqg.css']
 
-    df1 = gsheet2df(get_google_data(settings.TEST_RANGE))
 
-    df1.rename(columns={'Solar power generated (W)': 'Solar(W)',
-                       'Household consumption (kW)': 'House(kW)'}, inplace=True)
+def create_app(site_frames=None, profiles=None, fast_start=settings.FAST_START):
+    """ Builds the dashboard and returns its Flask server, for running under a WSGI server:
+    gunicorn --preload -w 4 --chdir solarpanel --pythonpath .. "solarpanel.app:create_app()"
+    With --preload the sensor history is loaded and the site profiles are built once in the master
+    process, and the forked workers share those pages copy-on-write instead of each loading their own.
+    With fast_start the server is returned at once and the sites load in a background thread (in each
+    worker, so without --preload), the page shows that it is loading and /readyz reports 503 until loaded.
+    """
+    loader = None
+    if site_frames is None and fast_start:
+        loader = SiteLoader(load_sites())
+        loader.ensure_running()
+    else:
+        # each site starts from its local copy of the sensor history, synced with its sheet concurrently,
+        # and is profiled straight from the mapped copy
+        if site_frames is None and profiles is None:
+            profiles = load_profiles(load_sites())
+        elif profiles is None:
+            profiles = build_profiles(site_frames)
+        # keep the garbage collector from touching (and so copying) the shared objects in every worker
+        gc.freeze()
 
-    df1["Solar(W)"] = pd.to_numeric(df1["Solar(W)"])
-    df1["House(kW)"] = pd.to_numeric(df1["House(kW)"])
-    df1["Generation(W/m2)"] = df1["Solar(W)"] / settings.PanelA
-    df1["Timestamp"] = pd.to_datetime(df1["Timestamp"].str.slice(0, 19),
-                                     format='%d/%m/%Y %H:%M:%S')  # convert timestamp to a datetime format that Python understands
+    app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
+    dash_test1(app, site_frames, profiles, loader)
+    server = app.server
 
-    external_stylesheets = ['https://codepen.io/meganb/pen/YzzwWqg.css']
+    # timings and counters on /metrics
+    metrics.init_app(server)
 
-    app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
-    dash_test1(app, df1)
-    app.run_server(debug=True)
+    # liveness - the process is serving requests
+    @server.route('/healthz')
+    def healthz():
+        return jsonify(status='ok')
+
+    # readiness - the sensor data is loaded and the dashboard can answer callbacks
+    @server.route('/readyz')
+    def readyz():
+        if loader is not None and not loader.ready.is_set():
+            return jsonify(status='loading', error=None if loader.error is None else str(loader.error)), 503
+        return jsonify(status='ready', sites=sorted(profiles if loader is None else loader.profiles))
+
+    if loader is not None:
+        # start loading in each forked worker, or again after a failed load
+        server.before_request(loader.ensure_running)
+
+    return server
+
+
+if __name__ == '__main__':
+    create_app().run(debug=True)
@@ -0,0 +1,176 @@
+# benchmarks for parsing, calculations, aggregation, figures and starting up, run offline against synthetic data
+# exits with an error if the prepared data is over its memory budget or startup is slower than settings.STARTUP_SECONDS
+# usage: python benchmark.py [--days 7 30 365] [--interval 1] [--output benchmarks.json]
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime as dt
+import plotly.graph_objs as go
+import plotly.utils
+from solarpanel.data_processing import get_google_data, load_sensor_frame, runcalcs
+from solarpanel.downsample import minmax_downsample
+from solarpanel.scenario import SolarProfile, evaluate_plans, evaluate_scenario
+from solarpanel.sheets import LocalSheetsClient, set_sheets_client
+from solarpanel.streaming import evaluate_stream, sheet_chunks
+from solarpanel.sweep import sweep_scenarios
+from solarpanel.synthetic import synthetic_sheets, write_local_sheets
+from solarpanel.tariffs import compile_plan
+import settings
+
+TARIFFS = (settings.default_feedin, settings.default_offpeak, settings.default_shoulder, settings.default_peak)
+PLAN = compile_plan(settings.TARIFF_PLAN)
+
+
+def measure(fn, repeat=3):
+    """ Best wall time of repeat runs (seconds) and peak traced memory of one run (bytes). """
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak
+
+
+# the size in bytes of a figure as it is sent to the browser
+def payload_size(figure):
+    return len(json.dumps(figure, cls=plotly.utils.PlotlyJSONEncoder))
+
+
+def stages(days, interval_minutes):
+    """ The benchmarked stages for one data size, each a function of nothing, in pipeline order. """
+    set_sheets_client(LocalSheetsClient(path=None, sheets=synthetic_sheets(days, interval_minutes)))
+    result = get_google_data(settings.TEST_RANGE)
+    df = load_sensor_frame(result)
+    profile = SolarProfile(df)
+    areas = iter(range(1, 10 ** 9))
+
+    def figure():
+        x, y = minmax_downsample(profile.timestamps, profile.generation)
+        return payload_size({'data': [go.Scatter(x=x, y=y, mode='lines')], 'layout': go.Layout()})
+
+    return [
+        ('fetch', lambda: get_google_data(settings.TEST_RANGE)),
+        ('parse', lambda: load_sensor_frame(result)),
+        ('runcalcs', lambda: runcalcs(df.copy(), settings.default_area, *TARIFFS)),
+        ('monthly_groupby', lambda: runcalcs(df.copy(), settings.default_area, *TARIFFS).groupby('Month').agg({"BillReduction": "sum"})),
+        ('profile', lambda: SolarProfile(df)),
+        ('scenario_new_area', lambda: evaluate_scenario(profile, next(areas), PLAN)),
+        ('scenario_tariff_change', lambda: evaluate_scenario(profile, settings.default_area, compile_plan(settings.TARIFF_PLAN))),
+        ('compare_plans', lambda: evaluate_plans(profile, settings.default_area, [compile_plan(plan) for plan in settings.TARIFF_PLANS])),
+        ('stream_10k_rows', lambda: evaluate_stream(sheet_chunks(settings.TEST_RANGE, 10000), settings.default_area, PLAN)),
+        ('sweep_30_areas', lambda: sweep_scenarios(profile, settings.sweep_areas, settings.sweep_panelcosts, [PLAN])),
+        ('figure', figure),
+    ]
+
+
+# memory held by a prepared profile against the budget documented in settings, returns True if within it
+def check_memory_budget(profile, size):
+    budget = settings.PROFILE_BYTES_PER_ROW * len(profile.generation)
+    print('{:<40} {:>10.1f}MB of {:.1f}MB budget'.format(size + ' profile memory', profile.nbytes / 2 ** 20, budget / 2 ** 20))
+    if profile.nbytes > budget:
+        print('Over the memory budget: {} profile'.format(size))
+        return False
+    return True
+
+
+def run(days_list, interval_minutes):
+    """ Runs every stage at each size, returns the results and whether every memory budget was met. """
+    results = {}
+    within_budget = True
+    for days in days_list:
+        size = '{}d@{}min'.format(days, interval_minutes)
+        for name, fn in stages(days, interval_minutes):
+            seconds, peak = measure(fn)
+            results['{}/{}'.format(size, name)] = {'seconds': seconds, 'peak_bytes': peak}
+            print('{:<40} {:>10.4f}s {:>10.1f}MB'.format(size + ' ' + name, seconds, peak / 2 ** 20))
+            if name == 'profile':
+                within_budget = check_memory_budget(fn(), size) and within_budget
+    return results, within_budget
+
+
+# run in a fresh python process with FAST_START: prints the time when the dashboard layout is served, then when the data is loaded
+STARTUP_SCRIPT = '''
+import time
+from solarpanel.app import create_app
+client = create_app().test_client()
+assert client.get('/_dash-layout').status_code == 200
+print(time.time())
+deadline = time.time() + 600
+while client.get('/readyz').status_code != 200 and time.time() < deadline:
+    time.sleep(0.05)
+print(time.time())
+'''
+
+
+def startup(days, interval_minutes):
+    """ Seconds from starting a fresh python process until it serves the dashboard layout, and until the sensor
+    data has loaded, with FAST_START against synthetic sheets and an empty local history.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'local_sheets.json')
+        write_local_sheets(path, days, interval_minutes)
+        env = dict(os.environ, FAST_START='1', SHEETS_BACKEND='local', LOCAL_SHEETS_PATH=path,
+                   STORE_PATH=os.path.join(directory, 'history'),
+                   PYTHONPATH=os.pathsep.join([os.path.dirname(here), here, os.environ.get('PYTHONPATH', '')]))
+        started = time.time()
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=here, env=env, check=True,
+                                stdout=subprocess.PIPE, universal_newlines=True).stdout
+    serving, ready = (float(line) - started for line in output.split()[-2:])
+    return serving, ready
+
+
+def compare(results, previous, threshold=0.2, min_seconds=0.001):
+    """ Prints the stages that got slower than the previous run by more than threshold, returns their names.
+    Stages faster than min_seconds are too noisy to compare.
+    """
+    slower = []
+    for key, result in results.items():
+        if key in previous and previous[key]['seconds'] > 0 and max(previous[key]['seconds'], result['seconds']) >= min_seconds:
+            change = result['seconds'] / previous[key]['seconds'] - 1
+            if change > threshold:
+                slower.append(key)
+                print('Slower than last run: {} {:+.0%}'.format(key, change))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the solar dashboard offline on synthetic sensor data.')
+    parser.add_argument('--days', type=int, nargs='+', default=[7, 30, 365])
+    parser.add_argument('--interval', type=int, default=1, help='minutes between readings')
+    parser.add_argument('--output', default='benchmarks.json', help='file the results of each run are appended to')
+    args = parser.parse_args()
+
+    results, passed = run(args.days, args.interval)
+    serving, ready = startup(max(args.days), args.interval)
+    results['startup/serving'] = {'seconds': serving, 'peak_bytes': None}
+    results['startup/ready'] = {'seconds': ready, 'peak_bytes': None}
+    print('{:<40} {:>10.4f}s'.format('startup serving', serving))
+    print('{:<40} {:>10.4f}s'.format('startup data loaded', ready))
+    if serving > settings.STARTUP_SECONDS:
+        print('Slower to start serving than the {}s target'.format(settings.STARTUP_SECONDS))
+        passed = False
+    history = []
+    if os.path.exists(args.output):
+        with open(args.output) as f:
+            history = json.load(f)
+    if history:
+        compare(results, history[-1]['results'])
+    history.append({'time': dt.now().isoformat(timespec='seconds'), 'results': results})
+    with open(args.output, 'w') as f:
+        json.dump(history, f, indent=1)
+    if not passed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+# small size-bounded cache for results that are expensive to compute, e.g. dashboard scenarios
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """ Least recently used cache holding at most maxsize results.
+    get(key, compute) returns the cached result for key, or calls compute() and caches its result,
+    evicting the least recently used entry when full. Hits, misses and evictions are counted.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        with self._lock:
+            if key in self._data:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return self._data[key]
+            self.misses += 1
+        value = compute()  # computed outside the lock so other keys aren't held up
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {'size': len(self._data), 'maxsize': self.maxsize,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
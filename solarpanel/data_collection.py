@@ -1 +1,170 @@
 # collect data and save data into google sheets
+import json
+import math
+import os
+import random
+import time
+from datetime import datetime as dt
+import httplib2
+from google.auth.exceptions import RefreshError, TransportError
+from solarpanel.sheets import GoogleSheetsClient
+import settings
+
+
+class SimulatedSensor:
+    """ Stand-in for the solar panel sensor for testing: a daylight curve peaking at peak_watts around midday, with noise. """
+
+    def __init__(self, peak_watts=0.8, noise=0.05, seed=None):
+        self.peak_watts = peak_watts
+        self.noise = noise
+        self.random = random.Random(seed)
+
+    def read(self):
+        """ Returns one reading as a sheet row: timestamp and solar power generated (W). """
+        now = dt.now()
+        hour = now.hour + now.minute / 60
+        daylight = max(0.0, math.sin((hour - 6) / 12 * math.pi))  # 6am to 6pm
+        watts = max(0.0, self.peak_watts * daylight + self.random.gauss(0, self.noise) * daylight)
+        return [now.strftime(settings.TIMESTAMP_FORMAT), round(watts, 4)]
+
+
+class WriteAheadLog:
+    """ Readings that haven't been saved to the sheet yet, kept on local disk so none are lost while the uplink is down.
+    Each reading is a JSON line appended to the log, and a separate file holds the byte offset of the
+    first reading not yet saved. The log is emptied once everything in it has been saved.
+    """
+
+    def __init__(self, path=settings.COLLECTOR_LOG_PATH):
+        self.path = path
+        self.offset_path = path + '.offset'
+
+    def append(self, row):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(row) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _offset(self):
+        try:
+            with open(self.offset_path) as f:
+                return int(f.read() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def pending(self, limit=None):
+        """ Returns up to limit readings not yet saved and the log offset just after them. """
+        offset = self._offset()
+        rows = []
+        if not os.path.exists(self.path):
+            return rows, offset
+        with open(self.path) as f:
+            f.seek(offset)
+            while limit is None or len(rows) < limit:
+                line = f.readline()
+                if not line.endswith('\n'):
+                    break  # end of the log, or a reading that is still being written
+                rows.append(json.loads(line))
+                offset = f.tell()
+        return rows, offset
+
+    def commit(self, offset):
+        """ Marks everything before offset as saved, emptying the log when nothing is left.
+        The offset is reset before the log is emptied, so a crash in between resends readings rather than losing them.
+        """
+        empty = offset >= os.path.getsize(self.path)
+        tmp = self.offset_path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(str(0 if empty else offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.offset_path)
+        if empty:
+            os.remove(self.path)
+
+
+# errors worth retrying later: quota/rate limits, server errors and the network being down, including DNS
+# failures and access tokens (which expire every hour) that can't be refreshed while it is
+def is_retryable(error):
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    if status is not None:
+        return int(status) in (429, 500, 502, 503, 504)
+    if isinstance(error, RefreshError):
+        # the token server couldn't be reached or failed, rather than the refresh token being revoked
+        cause = error.__cause__ or error.__context__
+        return bool(getattr(error, 'retryable', False)) or (cause is not None and is_retryable(cause))
+    return isinstance(error, (OSError, TimeoutError, httplib2.HttpLib2Error, TransportError))
+
+
+class Collector:
+    """ Reads the sensor every collect_seconds and saves the readings to the sheet in batches.
+    Every reading goes to the write-ahead log first. The log is flushed with one values().append
+    call once flush_rows readings are waiting or flush_seconds have passed. Quota and network errors
+    leave the readings in the log and back off exponentially (up to max_backoff_seconds) before retrying.
+    """
+
+    def __init__(self, sensor, client=None, sheet_range=settings.SENSOR_RANGE, spreadsheet_id=None,
+                 log=None, flush_rows=settings.flush_rows, flush_seconds=settings.flush_seconds,
+                 max_backoff_seconds=settings.max_backoff_seconds, max_batch_rows=10000):
+        self.sensor = sensor
+        self.client = client or GoogleSheetsClient(token_path=settings.COLLECTOR_TOKEN_PATH, scopes=settings.COLLECTOR_SCOPES)
+        self.sheet_range = sheet_range
+        self.spreadsheet_id = spreadsheet_id
+        self.log = log or WriteAheadLog()
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.max_batch_rows = max_batch_rows
+        self.waiting = len(self.log.pending()[0])  # readings left over from a previous run are sent first
+        self.last_flush = time.monotonic()
+        self.backoff = 0
+        self.retry_at = 0
+        self.appends = 0  # number of append calls made to the sheet
+
+    def collect(self):
+        """ Takes one reading, logs it and flushes the log if it is due. """
+        self.log.append(self.sensor.read())
+        self.waiting += 1
+        now = time.monotonic()
+        if now >= self.retry_at and (self.waiting >= self.flush_rows or now - self.last_flush >= self.flush_seconds):
+            self.flush()
+
+    def flush(self):
+        """ Sends the logged readings to the sheet, returns the number saved. """
+        saved = 0
+        while True:
+            rows, offset = self.log.pending(self.max_batch_rows)
+            if not rows:
+                break
+            try:
+                self.client.append(self.sheet_range, rows, self.spreadsheet_id)
+            except Exception as error:
+                if not is_retryable(error):
+                    raise
+                self.backoff = min(max(self.backoff * 2, settings.collect_seconds), self.max_backoff_seconds)
+                self.retry_at = time.monotonic() + self.backoff * random.uniform(0.5, 1)  # jitter so collectors don't retry together
+                print('Could not save readings, retrying in about {:.0f}s: {}'.format(self.backoff, error))
+                break
+            self.appends += 1
+            self.log.commit(offset)
+            saved += len(rows)
+            self.backoff = 0
+        self.waiting = max(0, self.waiting - saved)
+        self.last_flush = time.monotonic()
+        return saved
+
+    def run(self, collect_seconds=settings.collect_seconds):
+        try:
+            while True:
+                started = time.monotonic()
+                self.collect()
+                time.sleep(max(0.0, collect_seconds - (time.monotonic() - started)))
+        finally:
+            if time.monotonic() >= self.retry_at:
+                try:
+                    self.flush()  # anything that can't be saved now stays in the log for next time
+                except Exception as error:
+                    print('Could not save readings, they are kept in {}: {}'.format(self.log.path, error))
+
+
+if __name__ == '__main__':
+    Collector(SimulatedSensor()).run()
@@ -1,76 +1,124 @@
 from __future__ import print_function
-import pickle
-import os.path
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
 import pandas as pd
 import numpy as np
+from solarpanel.metrics import timed
+from solarpanel.sheets import get_sheets_client
+from solarpanel.tariffs import compile_plan, slot_index, with_rates
 import settings
 
-def get_google_data(SHEET_RANGE):
-    creds = None
-    # The file token.pickle stores the user's access and refresh tokens, and is
-    # created automatically when the authorization flow completes for the first
-    # time.
-    if os.path.exists('token.pickle'):
-        with open('token.pickle', 'rb') as token:
-            creds = pickle.load(token)
-    # If there are no (valid) credentials available, let the user log in.
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            flow = InstalledAppFlow.from_client_secrets_file(
-                'credentials.json', settings.SCOPES)
-            creds = flow.run_local_server(port=0)
-        # Save the credentials for the next run
-        with open('token.pickle', 'wb') as token:
-            pickle.dump(creds, token)
+@timed('sheets_request', call='get')
+def get_google_data(SHEET_RANGE, spreadsheet_id=None):
+    # Call the Sheets API through the shared client, which keeps its credentials and connection between calls
+    return get_sheets_client().get(SHEET_RANGE, spreadsheet_id)
+
+
+# read several ranges in one batchGet request, returns one result per range
+@timed('sheets_request', call='batch_get')
+def get_google_batch(SHEET_RANGES, spreadsheet_id=None):
+    return get_sheets_client().batch_get(SHEET_RANGES, spreadsheet_id)
 
-    service = build('sheets', 'v4', credentials=creds)
 
-    # Call the Sheets API
-    sheet = service.spreadsheets()
-    result = sheet.values().get(spreadsheetId=settings.SPREADSHEET_ID,
-                                range=SHEET_RANGE).execute()
-    return result
+# put the rows of a sheets API result into a data frame of text, one column per header cell
+def _sheet_frame(result):
+    rows = result.get('values', [])
+    if len(rows) < 2:
+        return None
+    header = rows[0]  # Assumes first line is header
+    # pandas fills short rows with None in one pass - the API drops trailing empty cells
+    df = pd.DataFrame(rows[1:])
+    df = df.reindex(columns=range(len(header)))
+    df.columns = header
+    return df.dropna(how='all').reset_index(drop=True)  # blank rows in the sheet come back as []
 
 
 # convert google sheet to pandas data frame
+@timed('parse')
 def gsheet2df(result):
-    """ Converts Google sheet data to a Pandas DataFrame.
+    """ Converts Google sheet data to a Pandas DataFrame of text columns.
     Note: This script assumes that your data contains a header file on the first row.
-    Also note that the Google API returns 'none' from empty cells - in order for the code
-    below to work, you'll need to make sure your sheet doesn't contain empty cells,
-    or update the code to account for such instances.
+    Short rows (the Google API drops trailing empty cells) are filled with None.
     """
-    header = result.get('values', [])[0]  # Assumes first line is header
-    values = result.get('values', [])[1:]  # Everything else is data.
-    if not values:
+    df = _sheet_frame(result)
+    if df is None:
         print('No data found.')
-    else:
-        all_data = []
-        for col_id, col_name in enumerate(header):
-            column_data = []
-            for row in values:
-                column_data.append(row[col_id])
-            ds = pd.Series(data=column_data, name=col_name)
-            all_data.append(ds)
-        df = pd.concat(all_data, axis=1)
-        return df
+    return df
+
+
+# convert google sheet to a typed pandas data frame in a single pass
+@timed('parse')
+def parse_sheet(result, schema=settings.SENSOR_SCHEMA, column_names=settings.COLUMN_NAMES,
+                timestamp_format=settings.TIMESTAMP_FORMAT):
+    """ Converts Google sheet data to a typed Pandas DataFrame.
+    Columns are renamed with column_names and converted according to schema (column name -> dtype,
+    'datetime' for timestamps parsed with timestamp_format). Each column is converted in bulk,
+    missing or unparseable cells become NaN/NaT and columns not in the schema are left as text.
+    """
+    df = _sheet_frame(result)
+    if df is None:
+        return pd.DataFrame({name: pd.Series(dtype='datetime64[ns]' if dtype == 'datetime' else dtype)
+                             for name, dtype in schema.items()})
+    df.columns = [column_names.get(name, name) for name in df.columns]
+    for name, dtype in schema.items():
+        if name not in df:
+            continue
+        if dtype == 'datetime':
+            df[name] = pd.to_datetime(df[name].str.slice(0, 19), format=timestamp_format, errors='coerce')
+        else:
+            df[name] = pd.to_numeric(df[name], errors='coerce').astype(dtype)
+    return df
+
+
+# add the generation per m2 of the sensor panel to typed sensor data
+def add_generation(df, panel_area=settings.PanelA):
+    df["Generation(W/m2)"] = df["Solar(W)"] / panel_area
+    return df
+
+
+# parse sensor data and add the generation per m2 of the sensor panel
+def load_sensor_frame(result, panel_area=settings.PanelA):
+    return add_generation(parse_sheet(result), panel_area)
+
+
+# nanoseconds since the epoch of a series or array of timestamps
+def _nanoseconds(timestamps):
+    return np.asarray(timestamps, dtype='datetime64[ns]').view('int64')
+
+
+# minutes between readings the sensor usually reports at - the median, as readings jitter and have gaps
+def nominal_interval(timestamps):
+    ns = _nanoseconds(timestamps)
+    return np.median(np.diff(ns)) / 6e10 if len(ns) > 1 else np.nan
+
+
+def interval_hours(timestamps, nominal=None, next_timestamp=None):
+    """ Hours each reading stands for, i.e. the time until the next reading, so energy is integrated over each
+    reading's own time delta however irregular the readings are. Gaps are explicit: a reading followed by more
+    than settings.gap_factor nominal intervals (minutes, the median interval by default) with no data counts
+    for the nominal interval only, the missing time isn't filled in. So does the last reading, unless
+    next_timestamp (of the reading after it) is given. Readings with a duplicate timestamp count for nothing.
+    """
+    ns = _nanoseconds(timestamps)
+    if nominal is None:
+        nominal = nominal_interval(timestamps)
+    nominal_ns = nominal * 6e10
+    last = np.datetime64(next_timestamp, 'ns').astype('int64') if next_timestamp is not None else ns[-1:] + nominal_ns
+    delta = np.diff(ns, append=last).astype(float)
+    delta[delta > settings.gap_factor * nominal_ns] = nominal_ns
+    return delta / 3.6e12
 
 
 # function to run calculations - takes in a dataframe of solar data, area of panels to install, tariffs and calculates generation, costs and savings
 
+@timed('runcalcs')
 def runcalcs(df, InstalledPanelA, TariffFeedIn, TariffOffPeak, TariffShoulder, TariffPeak):
-    df_tariffs = pd.Series([TariffOffPeak, TariffShoulder, TariffPeak], index=[0, 1, 2]) # grid tariffs in c/kWh: 0 = offpeak, 1 = shoulder, 2 = peak
+    # grid tariffs in c/kWh for the default plan's offpeak, shoulder and peak times
+    plan = compile_plan(with_rates(settings.TARIFF_PLAN, TariffFeedIn, offpeak=TariffOffPeak, shoulder=TariffShoulder, peak=TariffPeak))
 
     df["Generation(kW)"] = df["Generation(W/m2)"] * InstalledPanelA / 1000  # calculate generation from installed panels (hypothetical m2)
     df["SolarConsumed(kW)"] = df[["House(kW)", "Generation(kW)"]].min(axis=1) # based on what the house consumed, calculate how much solar is consumed
     df["SolarExported(kW)"] = (df["Generation(kW)"] - df["House(kW)"]).clip(lower=0)  # if there is solar exceeding what the house needs, export that to the grid
     df["GridConsumed(kW)"] = (df["House(kW)"] - df["Generation(kW)"]).clip(lower=0)  # if not enough solar is generated, will need electricity from the grid
-    Interval = pd.Timedelta(df["Timestamp"][1] - df["Timestamp"][0]).seconds / 60
+    df["Hours"] = interval_hours(df["Timestamp"])  # time each reading stands for, to integrate energy over irregular readings and gaps
     df["Weekday"] = df["Timestamp"].dt.dayofweek  # Monday = 0, Sunday = 6
     df["Month"] = df["Timestamp"].dt.month # month in number format - for use in summarising results
     df["Hour"] = df["Timestamp"].dt.hour # hour of this interval in number format - for determining appropriate tariff
@@ -79,20 +127,10 @@ def runcalcs(df, InstalledPanelA, TariffFeedIn, TariffOffPeak, TariffShoulder, T
     df_days = pd.Series([0, 0, 0, 0, 0, 1, 1], index=[0, 1, 2, 3, 4, 5, 6])  # 0 = weekday, 1 = weekend
     df["DayType"] = df["Weekday"].map(df_days) # m
 
-    # this sets up the timings for peak/offpeak tariffs from the grid
-    # uses times from Synergy current rates
-    # 0 = offpeak, 1 = shoulder, 2 = peak
-    conditions = [
-        (df["Hour"] < 7) | (df["Hour"] >= 21),  # before 7am or after 9pm
-        (df["Weekday"] == 0) & (df["Hour"] >= 7) & (df["Hour"] < 15),  # weekdays from 7am-3pm
-        (df["Weekday"] == 1) & (df["Hour"] >= 7) & (df["Hour"] < 21),  # weekends from 7am-9pm
-        (df["Weekday"] == 0) & (df["Hour"] >= 15) & (df["Hour"] < 21)]  # weekdays from 3pm-9pm
-    choices = [0, 1, 1, 2]
-
-    df["TariffType"] = np.select(conditions, choices) # identify which tariff applies in each interval
-    df["Tariff"] = df["TariffType"].map(df_tariffs)  # map actual tariffs in c/kWh onto the intervals
-
-    df["RevenueFeedIn"] = df["SolarExported(kW)"] / (60 / Interval) * TariffFeedIn / 100  # how much money is made from exporting solar
-    df["SavingsSolar"] = df["SolarConsumed(kW)"] / (60 / Interval) * df["Tariff"] / 100  # how much money is saved from using solar instead of grid
+    df["TariffType"] = plan.slots[slot_index(df["Timestamp"])]  # identify which tariff applies in each interval, by its slot of the week
+    df["Tariff"] = plan.prices[df["Month"] - 1, df["TariffType"]]  # map actual tariffs in c/kWh onto the intervals
+
+    df["RevenueFeedIn"] = df["SolarExported(kW)"] * df["Hours"] * plan.feedin[df["Month"] - 1] / 100  # how much money is made from exporting solar
+    df["SavingsSolar"] = df["SolarConsumed(kW)"] * df["Hours"] * df["Tariff"] / 100  # how much money is saved from using solar instead of grid
     df["BillReduction"] = df["RevenueFeedIn"] + df["SavingsSolar"]  # total reduction in electricity bill
     return df
@@ -1,13 +1,31 @@
+import dash
 import dash_core_components as dcc
 import dash_html_components as html
 import pandas as pd
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 import plotly.graph_objs as go
 from datetime import datetime as dt
-from solarpanel.data_processing import get_google_data, gsheet2df, runcalcs
+from solarpanel.scenario import evaluate_plans, evaluate_scenario, payback_period
+from solarpanel.sites import build_profiles, evaluate_sites, load_sites, panel_area
+from solarpanel.sweep import optimal_area, sweep_scenarios
+from solarpanel.tariffs import compile_plan, with_rates
+from solarpanel.cache import LRUCache
+from solarpanel.downsample import minmax_downsample, zoom_window
+from solarpanel.live import LivePoller, LiveSensorFeed
 import settings
 
-def dash_test1(app, df_annual):
+def dash_test1(app, site_frames, profiles=None, loader=None):
+    # a single sensor frame is shown as the first site in settings.SITES, and sites can be given as profiles alone
+    if isinstance(site_frames, pd.DataFrame):
+        site_frames = {settings.SITES[0]['name']: site_frames}
+    # with a SiteLoader the sites load in the background, and its profiles are filled in once they have
+    if loader is not None:
+        profiles = loader.profiles
+        sites = loader.sites
+    else:
+        sites = [site for site in load_sites() if site.name in (site_frames if profiles is None else profiles)]
+    site_names = [site.name for site in sites]
 
     # layout for the description and payback at the top
     def description_card():
@@ -31,11 +49,18 @@ def dash_test1(app, df_annual):
 
     # layout for all of the controls
     def generate_control_card():
+        loaded_names = [name for name in site_names if name in profiles]
         return html.Div(
             id="control-card",
             # controls in two columns
             children=[
                 html.B("Dashboard controls"),
+                html.P("Site:"),
+                dcc.Dropdown(id='site-select',
+                             options=[{'label': name, 'value': name} for name in loaded_names],
+                             value=loaded_names[0],
+                             clearable=False),
+                html.Br(),
                 html.Div(
                     id="two column controls",
                     children=[
@@ -89,127 +114,216 @@ def dash_test1(app, df_annual):
         )
 
     # overall layout
-    app.layout = html.Div(
-        id="app-container",
-        children=[
-            # Title and decription
-            html.Div(
-                id="titlebox",
-                className="twelve columns",
-                children=[description_card()],
-                style={'marginBottom': 20, 'marginTop': 20}
-            ),
+    def dashboard():
+        return html.Div(
+            id="app-container",
+            children=[
+                # Title and decription
+                html.Div(
+                    id="titlebox",
+                    className="twelve columns",
+                    children=[description_card()],
+                    style={'marginBottom': 20, 'marginTop': 20}
+                ),
 
-            # Controls on the left
-            html.Div(
-                id="left-column",
-                className="three columns",
-                children=[generate_control_card()],
-                style={'marginLeft': 10, 'marginRight': 0}
-            ),
+                # Controls on the left
+                html.Div(
+                    id="left-column",
+                    className="three columns",
+                    children=[generate_control_card()],
+                    style={'marginLeft': 10, 'marginRight': 0}
+                ),
+
+                # Charts on the right, in two tabs
+                html.Div(
+                    id="right-column",
+                    className="eight columns",
+                    children=[
+                        dcc.Tabs(id="tabs",
+                                 children=[
+                                     # First tab - live sensor data
+                                     dcc.Tab(label="Live sensor data",
+                                             children=[
+                                                 html.Div(
+                                                     id="livesensor-graph",
+                                                     children=[
+                                                         dcc.Graph(id="sensorstream"),
+                                                         dcc.Interval(id='interval-component', interval=settings.wait_seconds * 1000), # interval is in milliseconds so x1000
+                                                         dcc.Store(id='live-version'),  # version of the live data this browser already has
+                                                     ],
+                                                 ),
+                                             ],
+                                     ),
+
+                                     # Second tab - results of analysis, this tab has two columns
+                                     dcc.Tab(label="Analysis",
+                                             children=[
+                                                 # Left column
+                                                 html.Div(
+                                                     id="col1",
+                                                     className="six columns",
+                                                     children=[
+                                                         # Sensor data graph
+                                                         html.Div(
+                                                             id="sensor-graph",
+                                                             children=[
+                                                                 html.B("Sensor data in selected date range"),
+                                                                 dcc.Graph(id="sensorgraph", style={'height': '250px'}),
+                                                                 html.Hr(),
+                                                             ],
+                                                             style={'marginTop': 20, 'marginLeft': 0, 'marginRight': 10}
+                                                         ),
+
+                                                         # Detailed profile graph
+                                                         html.Div(
+                                                             id="profile-graph",
+                                                             children=[
+                                                                 html.B("Anticipated profile in selected date range"),
+                                                                 dcc.Graph(id="profilegraph", style={'height': '250px'}),
+                                                                 html.Hr(),
+                                                             ],
+                                                         ),
+                                                     ],
+                                                 ),
+
+                                                 # Right column
+                                                 html.Div(
+                                                     id="col2",
+                                                     className="six columns",
+                                                     children=[
+                                                         # Reduction in bills graph
+                                                         html.Div(
+                                                             id="reduction-graph",
+                                                             children=[
+                                                                 html.B("Monthly electricity bill savings"),
+                                                                 dcc.Graph(id="monthlysavingsgraph", style={'height': '250px'}),
+                                                                 html.Hr(),
+                                                             ],
+                                                             style={'marginTop': 20, 'marginLeft': 0, 'marginRight': 0}
+                                                         ),
+
+                                                         # Detailed breakdown graph
+                                                         html.Div(
+                                                             id="breakdown-graph",
+                                                             children=[
+                                                                 html.B("Monthly electricity breakdown by source"),
+                                                                 dcc.Graph(id="monthlydetailedgraph", style={'height': '250px'}),
+                                                                 html.Hr(),
+                                                             ],
+                                                         ),
+                                                     ],
+                                                 ),
+                                             ],
+                                     ),
+
+                                     # Third tab - payback for a range of panel areas and costs
+                                     dcc.Tab(label="Payback surface",
+                                             children=[
+                                                 html.Div(
+                                                     id="surface-graph",
+                                                     children=[
+                                                         html.Div(dcc.Markdown(id='optimalarea')),
+                                                         dcc.Graph(id="paybacksurface"),
+                                                     ],
+                                                     style={'marginTop': 20}
+                                                 ),
+                                             ],
+                                     ),
 
-            # Charts on the right, in two tabs
-            html.Div(
-                id="right-column",
-                className="eight columns",
-                children=[
-                    dcc.Tabs(id="tabs",
-                             children=[
-                                 # First tab - live sensor data
-                                 dcc.Tab(label="Live sensor data",
-                                         children=[
-                                             html.Div(
-                                                 id="livesensor-graph",
-                                                 children=[
-                                                     dcc.Graph(id="sensorstream"),
-                                                     dcc.Interval(id='interval-component', interval=settings.wait_seconds * 1000), # interval is in milliseconds so x1000
-                                                 ],
-                                             ),
-                                         ],
-                                 ),
-
-                                 # Second tab - results of analysis, this tab has two columns
-                                 dcc.Tab(label="Analysis",
-                                         children=[
-                                             # Left column
-                                             html.Div(
-                                                 id="col1",
-                                                 className="six columns",
-                                                 children=[
-                                                     # Sensor data graph
-                                                     html.Div(
-                                                         id="sensor-graph",
-                                                         children=[
-                                                             html.B("Sensor data in selected date range"),
-                                                             dcc.Graph(id="sensorgraph", style={'height': '250px'}),
-                                                             html.Hr(),
-                                                         ],
-                                                         style={'marginTop': 20, 'marginLeft': 0, 'marginRight': 10}
-                                                     ),
-
-                                                     # Detailed profile graph
-                                                     html.Div(
-                                                         id="profile-graph",
-                                                         children=[
-                                                             html.B("Anticipated profile in selected date range"),
-                                                             dcc.Graph(id="profilegraph", style={'height': '250px'}),
-                                                             html.Hr(),
-                                                         ],
-                                                     ),
-                                                 ],
-                                             ),
-
-                                             # Right column
-                                             html.Div(
-                                                 id="col2",
-                                                 className="six columns",
-                                                 children=[
-                                                     # Reduction in bills graph
-                                                     html.Div(
-                                                         id="reduction-graph",
-                                                         children=[
-                                                             html.B("Monthly electricity bill savings"),
-                                                             dcc.Graph(id="monthlysavingsgraph", style={'height': '250px'}),
-                                                             html.Hr(),
-                                                         ],
-                                                         style={'marginTop': 20, 'marginLeft': 0, 'marginRight': 0}
-                                                     ),
-
-                                                     # Detailed breakdown graph
-                                                     html.Div(
-                                                         id="breakdown-graph",
-                                                         children=[
-                                                             html.B("Monthly electricity breakdown by source"),
-                                                             dcc.Graph(id="monthlydetailedgraph", style={'height': '250px'}),
-                                                             html.Hr(),
-                                                         ],
-                                                     ),
-                                                 ],
-                                             ),
-                                         ],
-                                 ),
-                             ],
-                    ),
-                ],
-            )
-        ],
-    className='row'
-    )
+                                     # Fourth tab - annual savings under each tariff plan
+                                     dcc.Tab(label="Tariff plans",
+                                             children=[
+                                                 html.Div(
+                                                     id="plans-graph",
+                                                     children=[
+                                                         html.Div(dcc.Markdown(id='bestplan')),
+                                                         dcc.Graph(id="plansgraph"),
+                                                     ],
+                                                     style={'marginTop': 20}
+                                                 ),
+                                             ],
+                                     ),
+
+                                     # Fifth tab - savings across all of the sites
+                                     dcc.Tab(label="Fleet",
+                                             children=[
+                                                 html.Div(
+                                                     id="fleet-graph",
+                                                     children=[
+                                                         html.Div(dcc.Markdown(id='fleettotal')),
+                                                         dcc.Graph(id="fleetgraph"),
+                                                     ],
+                                                     style={'marginTop': 20}
+                                                 ),
+                                             ],
+                                     ),
+                                 ],
+                        ),
+                    ],
+                )
+            ],
+        className='row'
+        )
+
+    # shown while a loader is still loading the sites, polling until it has
+    def loading_page(message="Loading the sensor data..."):
+        return html.Div(
+            id="page",
+            children=[
+                html.H1("Residential Solar Installation Explorer"),
+                html.P(message),
+                dcc.Interval(id='loading-interval', interval=1000),
+            ],
+        )
 
     # ========================== All of the callbacks ==========================
 
-    # update live sensor data
-    @app.callback(Output('sensorstream', 'figure'),
-                  [Input('interval-component', 'n_intervals')])
-    def update_live(n):
-        df_actual = gsheet2df(get_google_data(settings.SENSOR_RANGE))
-        df_actual.rename(columns={'Solar power generated (W)': 'Solar(W)'}, inplace=True)
-        df_actual["Solar(W)"] = pd.to_numeric(df_actual["Solar(W)"])
-        df_actual["Generation(W/m2)"] = df_actual["Solar(W)"] / settings.PanelA
-        df_actual["Timestamp"] = pd.to_datetime(df_actual["Timestamp"].str.slice(0, 19),format='%d/%m/%Y %H:%M:%S')  # convert timestamp to a datetime format that Python understands
-
-        df_chart = df_actual.iloc[-settings.numlive:] # just to get the most recent entries
-        livedata = [go.Scatter(x=df_chart["Timestamp"], y=df_chart["Generation(W/m2)"], mode='lines')]
+    # time features and per-area energy totals for each site, prepared once so input changes don't re-run runcalcs
+    if profiles is None:
+        profiles = build_profiles(site_frames)
+
+    if loader is None:
+        app.layout = dashboard()
+    else:
+        # the layout is served at once, the dashboard's components (and so its callbacks) only appear once loaded
+        app.config.suppress_callback_exceptions = True
+        app.layout = lambda: dashboard() if loader.ready.is_set() else loading_page()
+
+        # replace the loading page with the dashboard once the sites have loaded
+        @app.callback(Output('page', 'children'),
+                      [Input('loading-interval', 'n_intervals')])
+        def show_dashboard(n):
+            if loader.ready.is_set():
+                return dashboard()
+            if loader.error is not None:
+                return loading_page('Could not load the sensor data, retrying: {}'.format(loader.error)).children
+            raise PreventUpdate
+    scenario_cache = LRUCache(settings.SCENARIO_CACHE_SIZE)
+    sweep_cache = LRUCache(16)
+
+    # ring buffer of the most recent live readings for each site, refreshed by one background poller for all clients
+    # while anyone is viewing the site
+    live_feeds = {site.name: LiveSensorFeed(site.sensor_range, spreadsheet_id=site.spreadsheet_id, panel_area=panel_area(site))
+                  for site in sites}
+    live_poller = LivePoller(live_feeds)
+
+    # update live sensor data, only when there is something newer than what this browser has
+    @app.callback([Output('sensorstream', 'figure'),
+                   Output('live-version', 'data')],
+                  [Input('interval-component', 'n_intervals'),
+                   Input('site-select', 'value')],
+                  [State('live-version', 'data')])
+    def update_live(n, site_name, client_version):
+        live_poller.ensure_running()
+        live_poller.request(site_name)
+        live_feed = live_feeds[site_name]
+        version = '{}:{}'.format(site_name, live_feed.version)
+        if version == client_version:
+            return dash.no_update, dash.no_update
+        df_actual = live_feed.frame()
+        if df_actual is None:
+            raise PreventUpdate
+        livedata = [go.Scatter(x=df_actual["Timestamp"], y=df_actual["Generation(W/m2)"], mode='lines')]
         return {
             'data': livedata,
             'layout': go.Layout(
@@ -219,51 +333,34 @@ def dash_test1(app, df_annual):
                     b=50,
                     t=10)
             ),
-        }
+        }, version
+
+    # the site's tariff plan with the rates from the inputs
+    def site_plan(site_name, feedin, offpeak, shoulder, peak):
+        plan = sites[site_names.index(site_name)].tariffs
+        return compile_plan(with_rates(plan, feedin, offpeak=offpeak, shoulder=shoulder, peak=peak))
+
+    # scenario results for (site, area, feed-in, off peak, shoulder, peak), so common configurations aren't recomputed
+    def get_scenario(site_name, area, feedin, offpeak, shoulder, peak):
+        return scenario_cache.get((site_name, area, feedin, offpeak, shoulder, peak),
+                                  lambda: evaluate_scenario(profiles[site_name], area,
+                                                            site_plan(site_name, feedin, offpeak, shoulder, peak)))
 
-    # update all charts that depend on dash inputs
+    # update the monthly charts, which depend on the site, area and tariffs
     @app.callback(
         [Output('monthlysavingsgraph', 'figure'),
-         Output('monthlydetailedgraph', 'figure'),
-         Output('payback', 'children'),
-         Output('sensorgraph', 'figure'),
-         Output('profilegraph', 'figure')],
+         Output('monthlydetailedgraph', 'figure')],
         [Input('input-area', 'value'),
          Input('input-feedin','value'),
          Input('input-offpeak','value'),
          Input('input-shoulder','value'),
          Input('input-peak','value'),
-         Input('input-panelcost','value'),
-         Input("date-picker-select", "start_date"),
-         Input("date-picker-select", "end_date")])
-
-    def update_figures(selected_area, selected_feedin, selected_offpeak, selected_shoulder, selected_peak, selected_panelcost, start_date, end_date):
-        df_1 = runcalcs(df_annual, selected_area, selected_feedin, selected_offpeak, selected_shoulder, selected_peak)
-
-        Interval = pd.Timedelta(df_1["Timestamp"][1] - df_1["Timestamp"][0]).seconds / 60
-
-        df_1["SolarConsumed(kWh)"] = df_1["SolarConsumed(kW)"] / (60 / Interval)
-        df_1["GridConsumed(kWh)"] = df_1["GridConsumed(kW)"] / (60 / Interval)
-        df_1["SolarExported(kWh)"] = df_1["SolarExported(kW)"] / (60 / Interval)
-
-        df_1_agg = df_1.groupby('Month', as_index=False).agg({"BillReduction": "sum"})
-
-        df_2_agg = df_1.groupby('Month', as_index=False).agg(
-            {"SolarConsumed(kWh)": "sum", "GridConsumed(kWh)": "sum", "SolarExported(kWh)": "sum"})
-
-        savings = df_1["BillReduction"].sum()
-        payback = selected_area * selected_panelcost / savings
-        years, months = divmod(payback, 1)
-        months = months * 12
-
-        df_3 = df_annual.set_index("Timestamp")[start_date:end_date]
-        df_3 = df_3.reset_index()
-
-        df_4 = df_1.set_index("Timestamp")[start_date:end_date]
-        df_4 = df_4.reset_index()
+         Input('site-select', 'value')])
+    def update_monthly(selected_area, selected_feedin, selected_offpeak, selected_shoulder, selected_peak, site_name):
+        scenario = get_scenario(site_name, selected_area, selected_feedin, selected_offpeak, selected_shoulder, selected_peak)
 
         # bar chart by month for reduction in electricity bill
-        plotdata1 = go.Bar(x=df_1_agg['Month'], y=df_1_agg['BillReduction'])
+        plotdata1 = go.Bar(x=scenario.months, y=scenario.bill_reduction)
         data1return = {'data': [plotdata1],
                        'layout': go.Layout(
                            xaxis={'title': 'Month'},
@@ -271,40 +368,174 @@ def dash_test1(app, df_annual):
                            margin=go.layout.Margin(b=50, t=10))}
 
         # bar chart by month showing split by solar consumed, grid consumed and solar exported
-        plotdata2 = [go.Bar(name='Solar consumed', x=df_2_agg['Month'], y=df_2_agg['SolarConsumed(kWh)']),
-                     go.Bar(name='Solar exported', x=df_2_agg['Month'], y=df_2_agg['SolarExported(kWh)']),
-                     go.Bar(name='Grid consumed', x=df_2_agg['Month'], y=df_2_agg['GridConsumed(kWh)'])]
+        plotdata2 = [go.Bar(name='Solar consumed', x=scenario.months, y=scenario.solar_consumed),
+                     go.Bar(name='Solar exported', x=scenario.months, y=scenario.solar_exported),
+                     go.Bar(name='Grid consumed', x=scenario.months, y=scenario.grid_consumed)]
         data2return = {'data': plotdata2,
                        'layout': go.Layout(
                            xaxis={'title': 'Month'},
                            yaxis={'title': 'Electricity (kWh)'},
                            margin=go.layout.Margin(b=50,t=10))}
 
+        return data1return, data2return
+
+    # update the payback text, which also depends on the panel cost
+    @app.callback(
+        Output('payback', 'children'),
+        [Input('input-area', 'value'),
+         Input('input-feedin','value'),
+         Input('input-offpeak','value'),
+         Input('input-shoulder','value'),
+         Input('input-peak','value'),
+         Input('input-panelcost','value'),
+         Input('site-select', 'value')])
+    def update_payback(selected_area, selected_feedin, selected_offpeak, selected_shoulder, selected_peak, selected_panelcost, site_name):
+        scenario = get_scenario(site_name, selected_area, selected_feedin, selected_offpeak, selected_shoulder, selected_peak)
+        years, months = payback_period(scenario, selected_area, selected_panelcost)
+
         # text for payback period at the top
-        data3return = '''Based on the inputs below the payback period is _**{:.0f} years and {:.0f} month(s)**_, with annual savings of _**${:,.2f}**_'''.format(
-            years, months, savings)
+        return '''Based on the inputs below the payback period is _**{:.0f} years and {:.0f} month(s)**_, with annual savings of _**${:,.2f}**_'''.format(
+            years, months, scenario.savings)
+
+    # window to re-render at full resolution if the graph's own zoom triggered the callback, None for the whole date range
+    def zoomed_window(graph_id, relayout_data):
+        if '{}.relayoutData'.format(graph_id) not in [t['prop_id'] for t in dash.callback_context.triggered]:
+            return None  # site, dates or area changed, show the whole range again
+        if not any(key.startswith('xaxis.') for key in relayout_data or {}):
+            raise PreventUpdate  # e.g. autosize or a y axis change, nothing new to fetch
+        return zoom_window(relayout_data)
+
+    # x axis of a time series graph, keeping the zoomed window if there is one
+    def time_axis(window):
+        if window is None:
+            return {'title': 'Timestamp'}
+        return {'title': 'Timestamp', 'range': [str(window[0]), str(window[1])]}
+
+    # update the sensor data graph, which only depends on the site, dates and its zoom
+    @app.callback(
+        Output('sensorgraph', 'figure'),
+        [Input("date-picker-select", "start_date"),
+         Input("date-picker-select", "end_date"),
+         Input('sensorgraph', 'relayoutData'),
+         Input('site-select', 'value')])
+    def update_sensorgraph(start_date, end_date, relayout_data, site_name):
+        window = zoomed_window('sensorgraph', relayout_data)
+        timestamps, generation, _ = profiles[site_name].readings(start_date, end_date, window)
+
+        # annual sensor data graph, from the rollups for wide ranges and downsampled to about the number of points the graph can show
+        x, y = minmax_downsample(timestamps, generation)
+        plotdata3 = [go.Scatter(x=x, y=y, mode='lines')]
+        return {'data': plotdata3,
+                'layout': go.Layout(
+                    xaxis=time_axis(window),
+                    yaxis={'title': 'Solar power (W/m2)'},
+                    margin=go.layout.Margin(b=50,t=10))}
+
+    # update the detailed profile graph, which depends on the site, area, dates and its zoom
+    @app.callback(
+        Output('profilegraph', 'figure'),
+        [Input('input-area', 'value'),
+         Input("date-picker-select", "start_date"),
+         Input("date-picker-select", "end_date"),
+         Input('profilegraph', 'relayoutData'),
+         Input('site-select', 'value')])
+    def update_profilegraph(selected_area, start_date, end_date, relayout_data, site_name):
+        window = zoomed_window('profilegraph', relayout_data)
+        df_4 = profiles[site_name].series(selected_area, start_date, end_date, window)
+
+        # detailed profile line chart, each trace downsampled separately
+        plotdata4 = []
+        for name, column in [('Solar consumed', "SolarConsumed(kW)"), ('Solar exported', "SolarExported(kW)"), ('Grid consumed', "GridConsumed(kW)")]:
+            x, y = minmax_downsample(df_4["Timestamp"].to_numpy(), df_4[column].to_numpy())
+            plotdata4.append(go.Scatter(name=name, x=x, y=y, mode='lines'))
+        return {'data': plotdata4,
+                'layout': go.Layout(
+                    xaxis=time_axis(window),
+                    yaxis={'title': 'Electricity (kW)'},
+                    margin=go.layout.Margin(b=50,t=10))}
+
+    # update the payback surface over panel areas and costs, which depends on the site, tariffs and panel cost
+    @app.callback(
+        [Output('paybacksurface', 'figure'),
+         Output('optimalarea', 'children')],
+        [Input('input-feedin','value'),
+         Input('input-offpeak','value'),
+         Input('input-shoulder','value'),
+         Input('input-peak','value'),
+         Input('input-panelcost','value'),
+         Input('site-select', 'value')])
+    def update_surface(selected_feedin, selected_offpeak, selected_shoulder, selected_peak, selected_panelcost, site_name):
+        tariffs = (selected_feedin, selected_offpeak, selected_shoulder, selected_peak)
+        sweep = sweep_cache.get((site_name, tariffs),
+                                lambda: sweep_scenarios(profiles[site_name], settings.sweep_areas, settings.sweep_panelcosts,
+                                                        [site_plan(site_name, *tariffs)]))
+        best_areas, net_savings = optimal_area(sweep, selected_panelcost)
 
-        # annual sensor data graph
-        plotdata3 = [go.Scatter(x=df_3["Timestamp"], y=df_3["Generation(W/m2)"], mode='lines')]
-        data4return =  {'data': plotdata3,
+        # heatmap of payback (years) by panel area and panel cost
+        plotdata5 = [go.Heatmap(x=sweep.panelcosts, y=sweep.areas, z=sweep.payback[:, 0, :],
+                                colorbar={'title': 'Payback (years)'})]
+        data6return = {'data': plotdata5,
+                       'layout': go.Layout(
+                           xaxis={'title': 'Cost of panels ($/m\u00b2)'},
+                           yaxis={'title': 'Area of panels (m\u00b2)'},
+                           margin=go.layout.Margin(b=50, t=10))}
+
+        # text for the area with the largest net saving over the panels' life at the selected panel cost
+        if net_savings[0] > 0:
+            data7return = '''At the selected panel cost the largest saving over a {} year panel life is _**${:,.2f}**_, for _**{:.0f} m\u00b2**_ of panels'''.format(
+                settings.panel_life, net_savings[0], best_areas[0])
+        else:
+            data7return = '''At the selected panel cost no area of panels pays for itself over a {} year panel life'''.format(settings.panel_life)
+        return data6return, data7return
+
+    # update the tariff plan comparison - the site's plan with the selected rates against the other plans in settings
+    @app.callback(
+        [Output('plansgraph', 'figure'),
+         Output('bestplan', 'children')],
+        [Input('input-area', 'value'),
+         Input('input-feedin','value'),
+         Input('input-offpeak','value'),
+         Input('input-shoulder','value'),
+         Input('input-peak','value'),
+         Input('site-select', 'value')])
+    def update_plans(selected_area, selected_feedin, selected_offpeak, selected_shoulder, selected_peak, site_name):
+        own_plan = sites[site_names.index(site_name)].tariffs
+        plans = [site_plan(site_name, selected_feedin, selected_offpeak, selected_shoulder, selected_peak)]
+        plans += [compile_plan(plan) for plan in settings.TARIFF_PLANS if plan['name'] != own_plan['name']]
+        scenarios = evaluate_plans(profiles[site_name], selected_area, plans)
+
+        plotdata7 = [go.Bar(x=[plan.name for plan in plans], y=[scenario.savings for scenario in scenarios])]
+        data10return = {'data': plotdata7,
                         'layout': go.Layout(
-                            xaxis={'title': 'Timestamp'},
-                            yaxis={'title': 'Solar power (W/m2)'},
-                            margin=go.layout.Margin(b=50,t=10))}
-
-        # detailed profile line chart
-        plotdata4 = [go.Scatter(name='Solar consumed', x=df_4["Timestamp"], y=df_4["SolarConsumed(kW)"], mode='lines'),
-                     go.Scatter(name='Solar exported', x=df_4["Timestamp"], y=df_4["SolarExported(kW)"], mode='lines'),
-                     go.Scatter(name='Grid consumed', x=df_4["Timestamp"], y=df_4["GridConsumed(kW)"], mode='lines'),]
-        data5return = {'data': plotdata4,
+                            xaxis={'title': 'Tariff plan'},
+                            yaxis={'title': 'Annual savings ($)'},
+                            margin=go.layout.Margin(b=50, t=10))}
+
+        best = max(range(len(plans)), key=lambda i: scenarios[i].savings)
+        data11return = '''The panels save the most on the _**{}**_ plan, _**${:,.2f}**_ a year'''.format(
+            plans[best].name, scenarios[best].savings)
+        return data10return, data11return
+
+    # update the fleet view - annual savings of every site at the selected area, each with its own tariffs
+    @app.callback(
+        [Output('fleetgraph', 'figure'),
+         Output('fleettotal', 'children')],
+        [Input('input-area', 'value')])
+    def update_fleet(selected_area):
+        scenarios = evaluate_sites(profiles, sites, selected_area)
+
+        plotdata6 = [go.Bar(x=list(scenarios), y=[scenario.savings for scenario in scenarios.values()])]
+        data8return = {'data': plotdata6,
                        'layout': go.Layout(
-                           xaxis={'title': 'Timestamp'},
-                           yaxis={'title': 'Electricity (kW)'},
-                           margin=go.layout.Margin(b=50,t=10))}
+                           xaxis={'title': 'Site'},
+                           yaxis={'title': 'Annual savings ($)'},
+                           margin=go.layout.Margin(b=50, t=10))}
 
-        return data1return, data2return, data3return, data4return, data5return
+        data9return = '''Across all {} sites the annual savings are _**${:,.2f}**_'''.format(
+            len(scenarios), sum(scenario.savings for scenario in scenarios.values()))
+        return data8return, data9return
 
-    # reset all inputs back to default values
+    # reset all inputs back to default values, with the tariffs of the selected site
     @app.callback(
         [Output('input-area', 'value'),
          Output('input-feedin', 'value'),
@@ -314,13 +545,15 @@ def dash_test1(app, df_annual):
          Output('input-panelcost','value'),
          Output("date-picker-select", "start_date"),
          Output("date-picker-select", "end_date")],
-        [Input('reset-btn', 'n_clicks')])
-    def resetall(n):
+        [Input('reset-btn', 'n_clicks')],
+        [State('site-select', 'value')])
+    def resetall(n, site_name):
+        plan = sites[site_names.index(site_name)].tariffs
         return settings.default_area, \
-               settings.default_feedin, \
-               settings.default_offpeak, \
-               settings.default_shoulder, \
-               settings.default_peak, \
+               plan['feedin'], \
+               plan['rates'].get('offpeak', settings.default_offpeak), \
+               plan['rates'].get('shoulder', settings.default_shoulder), \
+               plan['rates'].get('peak', settings.default_peak), \
                settings.default_panelcost, \
                settings.default_startdate, \
                settings.default_enddate
\ No newline at end of file
@@ -0,0 +1,38 @@
+# reduce time series to about as many points as a chart can show before sending them to the browser
+import numpy as np
+import pandas as pd
+import settings
+
+
+def minmax_downsample(x, y, max_points=settings.max_points):
+    """ Splits the rows into max_points / 2 equal buckets and keeps the minimum and maximum of y in each,
+    so a trace never has more than max_points points but peaks and dips still show up.
+    Returns x and y unchanged if they are already short enough.
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n <= max_points:
+        return x, y
+    buckets = max(max_points // 2, 1)
+    size = -(-n // buckets)  # rows per bucket, rounded up
+    values = np.concatenate([y, np.full(size * buckets - n, np.nan)]).reshape(buckets, size)
+    missing = np.isnan(values)
+    offsets = np.arange(buckets) * size
+    lowest = offsets + np.argmin(np.where(missing, np.inf, values), axis=1)
+    highest = offsets + np.argmax(np.where(missing, -np.inf, values), axis=1)
+    index = np.unique(np.concatenate([lowest, highest]))
+    index = index[index < n]
+    return x[index], y[index]
+
+
+# the x axis window the user has zoomed to from a graph's relayoutData, or None when showing everything
+def zoom_window(relayout_data):
+    if not relayout_data or relayout_data.get('xaxis.autorange'):
+        return None
+    if 'xaxis.range[0]' in relayout_data and 'xaxis.range[1]' in relayout_data:
+        start, end = relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']
+    elif 'xaxis.range' in relayout_data:
+        start, end = relayout_data['xaxis.range']
+    else:
+        return None
+    return pd.Timestamp(start), pd.Timestamp(end)
@@ -0,0 +1,126 @@
+# keep the most recent live sensor readings in memory, only fetching new rows from google sheets
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from solarpanel.data_processing import get_google_batch, get_google_data, load_sensor_frame
+from solarpanel.sheets import sheet_range, split_range
+import settings
+
+
+class LiveSensorFeed:
+    """ Incremental reader for the live sensor sheet.
+    Remembers the last sheet row that has already been read and only requests the rows
+    after it (e.g. 'real_data!A101:D'), keeping the most recent readings in a ring buffer
+    of numlive rows. The cost of a poll depends on the number of new rows, not on the
+    length of the sheet. version changes whenever new readings arrive.
+    """
+
+    def __init__(self, sensor_range=settings.SENSOR_RANGE, size=settings.numlive, spreadsheet_id=None,
+                 panel_area=settings.PanelA):
+        self.sensor_range = sensor_range
+        self.spreadsheet_id = spreadsheet_id
+        self.panel_area = panel_area
+        self.header = None
+        self.last_row = None  # last sheet row (1-based, header is row 1) already read
+        self.rows = deque(maxlen=size)
+        self._frame = None
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        """ Identifies the readings in the buffer - the number of sheet rows read, the same in every process. """
+        return self.last_row
+
+    def _start(self):
+        # header row, plus the first column only to find where the sheet currently ends, in one request
+        first_col = split_range(self.sensor_range)[1]
+        header, timestamps = get_google_batch([sheet_range(self.sensor_range, 1, 1),
+                                               sheet_range(self.sensor_range, 1, columns=(first_col, first_col))],
+                                              self.spreadsheet_id)
+        header, timestamps = header.get('values', []), timestamps.get('values', [])
+        if not header:
+            return False
+        self.header = header[0]
+        # skip straight to the tail of the sheet, the ring buffer only needs the last numlive rows
+        self.last_row = max(1, len(timestamps) - self.rows.maxlen)
+        return True
+
+    def poll(self):
+        """ Fetches any rows added since the last poll, returns the number of new rows. """
+        with self._lock:
+            if self.header is None and not self._start():
+                return 0
+            new_rows = get_google_data(sheet_range(self.sensor_range, self.last_row + 1), self.spreadsheet_id).get('values', [])
+            if new_rows:
+                self.last_row += len(new_rows)
+                self.rows.extend(row for row in new_rows if row)  # the API returns [] for blank rows
+                self._frame = None
+            return len(new_rows)
+
+    def frame(self):
+        """ Returns the buffered readings as a typed data frame, or None if nothing has been read yet. """
+        with self._lock:
+            if self._frame is None and self.header is not None and self.rows:
+                self._frame = load_sensor_frame({'values': [self.header] + list(self.rows)}, self.panel_area)
+            return self._frame
+
+
+class LivePoller:
+    """ Background thread that polls the live feeds being viewed once per interval, however many dashboards are open.
+    Callbacks only read the feeds, and call request(name) each time so the feed is polled for the next
+    stale_intervals intervals - feeds nobody is viewing aren't polled. The feeds are polled concurrently by a
+    pool of up to max_workers threads, so a poll costs about one Sheets round trip however many sites there are.
+    The thread is started on first use in each process, so it also runs in every worker forked from a preloaded app.
+    """
+
+    def __init__(self, feeds, interval=settings.wait_seconds, max_workers=settings.FETCH_WORKERS, stale_intervals=3):
+        self.feeds = feeds
+        self.interval = interval
+        self.max_workers = max_workers
+        self.stale_intervals = stale_intervals
+        self.requested = {}  # feed name -> time.monotonic() it was last asked for
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+
+    def ensure_running(self):
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='live-poller', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def request(self, name):
+        """ Marks a feed as being viewed. One that wasn't is polled at once rather than at the next interval. """
+        if not self._is_active(name, time.monotonic()):
+            self._wake.set()
+        self.requested[name] = time.monotonic()
+
+    def _is_active(self, name, now):
+        requested = self.requested.get(name)
+        return requested is not None and now - requested <= self.stale_intervals * self.interval
+
+    def poll_all(self, pool):
+        now = time.monotonic()
+        names = [name for name in self.feeds if self._is_active(name, now)]
+        for name, future in [(name, pool.submit(self.feeds[name].poll)) for name in names]:
+            try:
+                future.result()
+            except Exception as error:
+                print('Could not poll live data for {}: {}'.format(name, error))
+
+    def _run(self):
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='live-poll') as pool:
+            while not self._stop.is_set():
+                self._wake.clear()
+                self.poll_all(pool)
+                self._wake.wait(self.interval)
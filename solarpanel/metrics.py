@@ -0,0 +1,157 @@
+# timings and counters for the hot paths, served in Prometheus text format on /metrics
+import cProfile
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+import settings
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7)
+
+_counters = {}  # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+_buckets = {}  # name -> bucket upper bounds
+_lock = threading.Lock()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """ Adds value to a counter. """
+    if not settings.METRICS_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, buckets=SECONDS_BUCKETS, **labels):
+    """ Records one value (e.g. a duration in seconds) in a histogram. """
+    if not settings.METRICS_ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _buckets.setdefault(name, buckets)
+        counts = _histograms.setdefault(key, [0] * (len(buckets) + 2))
+        for i, bound in enumerate(_buckets[name]):
+            if value <= bound:
+                counts[i] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+
+@contextmanager
+def timer(name, **labels):
+    """ Times the block into the histogram name_seconds and counts exceptions in name_errors. """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        inc(name + '_errors', **labels)
+        raise
+    finally:
+        observe(name + '_seconds', time.perf_counter() - started, **labels)
+
+
+def timed(name, **labels):
+    """ Decorator version of timer. Costs one settings check per call when metrics are disabled. """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not settings.METRICS_ENABLED:
+                return fn(*args, **kwargs)
+            with timer(name, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs) + '}'
+
+
+def render():
+    """ All metrics in Prometheus text exposition format. """
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, list(counts)) for key, counts in _histograms.items())
+        buckets = dict(_buckets)
+    typed = set()
+    for (name, labels), value in counters:
+        metric = 'solarpanel_{}_total'.format(name)
+        if metric not in typed:
+            lines.append('# TYPE {} counter'.format(metric))
+            typed.add(metric)
+        lines.append('{}{} {}'.format(metric, _labels(labels), value))
+    for (name, labels), counts in histograms:
+        metric = 'solarpanel_' + name
+        if metric not in typed:
+            lines.append('# TYPE {} histogram'.format(metric))
+            typed.add(metric)
+        for bound, count in zip(buckets[name], counts):
+            lines.append('{}_bucket{} {}'.format(metric, _labels(labels, [('le', bound)]), count))
+        lines.append('{}_bucket{} {}'.format(metric, _labels(labels, [('le', '+Inf')]), counts[-1]))
+        lines.append('{}_sum{} {}'.format(metric, _labels(labels), counts[-2]))
+        lines.append('{}_count{} {}'.format(metric, _labels(labels), counts[-1]))
+    return '\n'.join(lines) + '\n'
+
+
+def init_app(server):
+    """ Adds /metrics to the Flask server behind the Dash app, and times every Dash callback request,
+    labelled by its outputs, along with the size of the response sent to the browser.
+    If settings.PROFILE_SLOW_CALLBACKS is set, callbacks slower than that many seconds have a cProfile
+    dump written to settings.PROFILE_PATH.
+    """
+    from flask import Response, g, request
+
+    @server.route('/metrics')
+    def metrics():
+        return Response(render(), mimetype='text/plain; version=0.0.4')
+
+    if not settings.METRICS_ENABLED:
+        return
+
+    @server.before_request
+    def start_callback():
+        if request.path.endswith('/_dash-update-component'):
+            g.callback_started = time.perf_counter()
+            if settings.PROFILE_SLOW_CALLBACKS is not None:
+                g.callback_profile = cProfile.Profile()
+                g.callback_profile.enable()
+
+    @server.after_request
+    def end_callback(response):
+        started = g.pop('callback_started', None)
+        if started is None:
+            return response
+        seconds = time.perf_counter() - started
+        output = (request.get_json(silent=True) or {}).get('output', 'unknown')
+        observe('callback_seconds', seconds, output=output)
+        observe('callback_response_bytes', response.calculate_content_length() or 0, buckets=BYTES_BUCKETS, output=output)
+        if response.status_code >= 500:
+            inc('callback_errors', output=output)
+        profile = g.pop('callback_profile', None)
+        if profile is not None:
+            profile.disable()
+            if seconds >= settings.PROFILE_SLOW_CALLBACKS:
+                os.makedirs(settings.PROFILE_PATH, exist_ok=True)
+                name = '{}-{}.prof'.format(''.join(c if c.isalnum() else '_' for c in output)[:100], int(time.time() * 1000))
+                profile.dump_stats(os.path.join(settings.PROFILE_PATH, name))
+        return response
+
+    # unhandled exceptions skip after_request
+    @server.teardown_request
+    def abort_callback(error):
+        profile = g.pop('callback_profile', None)
+        if profile is not None:
+            profile.disable()
+        if error is not None and g.pop('callback_started', None) is not None:
+            inc('callback_errors', output=(request.get_json(silent=True) or {}).get('output', 'unknown'))
@@ -0,0 +1,94 @@
+# hourly, daily and monthly totals of the sensor readings, kept up to date as readings arrive so wide date ranges don't scan every reading
+import numpy as np
+
+# name and numpy datetime unit of each level, finest first
+LEVELS = (('hour', 'h'), ('day', 'D'), ('month', 'M'))
+# per bucket: generation (Wh/m2) and the hours it covers, house consumption (kWh) and the hours it covers
+COLUMNS = 4
+
+
+class Rollup:
+    """ One level of totals - the start of each bucket and, per bucket, the energy generated and consumed and
+    the hours covered by readings of each, so averages leave out gaps and missing readings.
+    """
+
+    def __init__(self, unit):
+        self.unit = unit
+        self.starts = np.empty(0, dtype='datetime64[ns]')
+        self.totals = np.empty((0, COLUMNS))
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def nbytes(self):
+        return self.starts.nbytes + self.totals.nbytes
+
+    def add(self, timestamps, values):
+        """ Adds rows of the totals columns, later than any already added, merging into the last bucket if they
+        share it. Returns the start and totals of each bucket of the new rows alone, for the next level up.
+        """
+        starts, first = self.runs(timestamps)
+        if not len(starts):
+            return starts, values
+        totals = np.add.reduceat(values, first)
+        new_starts, new_totals = starts, totals
+        if len(self.starts) and starts[0] == self.starts[-1]:
+            self.totals[-1] += totals[0]
+            new_starts, new_totals = starts[1:], totals[1:]
+        self.starts = np.concatenate([self.starts, new_starts])
+        self.totals = np.concatenate([self.totals, new_totals])
+        return starts, totals
+
+    def runs(self, timestamps):
+        """ Start of each bucket of some timestamps in time order, and the index of the first timestamp in each. """
+        buckets = np.asarray(timestamps, dtype='datetime64[ns]').astype('datetime64[{}]'.format(self.unit)).astype('datetime64[ns]')
+        first = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]]) if len(buckets) else np.empty(0, dtype=int)
+        return buckets[first], first
+
+    def rows(self, start, end):
+        """ Slice of the buckets holding readings from start to end (inclusive). """
+        start = np.datetime64(start, 'ns').astype('datetime64[{}]'.format(self.unit)).astype('datetime64[ns]')
+        return slice(self.starts.searchsorted(start), self.starts.searchsorted(np.datetime64(end, 'ns'), side='right'))
+
+    def means(self, rows=slice(None)):
+        """ Start of each bucket, and the average generation (W/m2) and house consumption (kW) while there were readings. """
+        totals = self.totals[rows]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.starts[rows], totals[:, 0] / totals[:, 1], totals[:, 2] / totals[:, 3]
+
+
+class Rollups:
+    """ Every level of totals, updated together. """
+
+    def __init__(self):
+        self.levels = {name: Rollup(unit) for name, unit in LEVELS}
+
+    def __getitem__(self, name):
+        return self.levels[name]
+
+    @property
+    def nbytes(self):
+        return sum(rollup.nbytes for rollup in self.levels.values())
+
+    def add(self, timestamps, hours, generation, house):
+        """ Adds readings later than any already added - their timestamps, the hours each stands for
+        (see interval_hours), generation (W/m2) and house consumption (kW).
+        """
+        # readings are summed a column at a time into the finest buckets, and each level from the buckets of the one below
+        timestamps, first = self.levels[LEVELS[0][0]].runs(timestamps)
+        if not len(first):
+            return
+        generated, consumed = np.isfinite(generation), np.isfinite(house)
+        columns = [(generated, generation), (generated, None), (consumed, house), (consumed, None)]  # energy and hours covered
+        values = np.column_stack([np.add.reduceat(np.where(ok, hours if kw is None else kw * hours, 0), first) for ok, kw in columns])
+        for rollup in self.levels.values():
+            timestamps, values = rollup.add(timestamps, values)
+
+    def level(self, start, end, max_rows):
+        """ Finest level with at most max_rows buckets from start to end, and the slice of those buckets. """
+        for name, _ in LEVELS:
+            rows = self.levels[name].rows(start, end)
+            if rows.stop - rows.start <= max_rows:
+                break
+        return self.levels[name], rows
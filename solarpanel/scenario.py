@@ -0,0 +1,197 @@
+# sensor data prepared once so dashboard scenarios (panel area, tariffs, panel cost) can be evaluated without re-running runcalcs
+import threading
+from collections import OrderedDict, namedtuple
+import numpy as np
+import pandas as pd
+from solarpanel.data_processing import add_generation, interval_hours, nominal_interval
+from solarpanel.metrics import timed
+from solarpanel.rollup import Rollups
+from solarpanel.tariffs import BIN_DTYPE, WEEK_SLOTS, slot_index, slot_prices
+import settings
+
+# results of one scenario - per month arrays for the months that have sensor data
+Scenario = namedtuple('Scenario', ['months', 'bill_reduction', 'solar_consumed', 'solar_exported', 'grid_consumed', 'savings'])
+
+
+class SolarProfile:
+    """ Time features and per-area energy totals of the sensor data, built once from the sensor frame.
+    Generation, consumption and export only depend on the installed panel area, and the bill reduction
+    is linear in the tariffs, so kWh totals per (month, slot of the week) are enough to evaluate any
+    tariff plan with a gather of its compiled prices.
+    Totals are kept for the most recently used areas. The sensor frame is never modified.
+    Each reading is integrated over its own time delta (see interval_hours), and hourly, daily and monthly
+    rollups of the readings are kept for charts over wide date ranges.
+
+    The profile is kept lean so each dashboard process holds as little as possible: readings are float32
+    (the sensors report 4 decimal places), the time features are a single int16 bin (int32 for tariff slots under
+    5 minutes, see BIN_DTYPE) and everything else is computed on demand. Rows are sorted by timestamp so a date range is a slice, i.e. views rather than copies.
+    A profile built from_store doesn't hold its timestamps at all, they are the store's mapped file.
+    Memory budget: settings.PROFILE_BYTES_PER_ROW per reading (see nbytes), about 10MB for a year of
+    minute data, plus about 40 bytes an hour for the rollups; benchmark.py checks it.
+    """
+
+    def __init__(self, df, max_areas=32):
+        df = df[df["Timestamp"].notna()]
+        if not df["Timestamp"].is_monotonic_increasing:
+            df = df.sort_values("Timestamp", kind='mergesort')
+        self._prepare(pd.DatetimeIndex(df["Timestamp"]), df["Generation(W/m2)"], df["House(kW)"], max_areas)
+
+    @classmethod
+    def from_store(cls, store, panel_area, max_areas=32):
+        """ Profile of the history in a HistoryStore, built straight from its memory-mapped columns rather than
+        a frame. The timestamps stay a view of the mapped file, so every process holding the profile shares
+        those pages, and only the float32 readings are the process's own.
+        """
+        arrays = store.arrays()
+        timestamps = pd.DatetimeIndex(arrays["Timestamp"], copy=False)
+        if timestamps.hasnans or not timestamps.is_monotonic_increasing:
+            # missing or out of order timestamps have to be dropped or sorted, i.e. copied
+            return cls(add_generation(store.load(), panel_area), max_areas)
+        profile = cls.__new__(cls)
+        profile._prepare(timestamps, arrays["Solar(W)"] / panel_area, arrays["House(kW)"], max_areas, store)
+        return profile
+
+    def _prepare(self, timestamps, generation, house, max_areas, store=None):
+        self.timestamps = timestamps
+        self.generation = np.asarray(generation, dtype='float32')
+        self.house = np.asarray(house, dtype='float32')
+        self.store = store  # the HistoryStore the timestamps are mapped from, if any
+        self.interval = nominal_interval(timestamps)  # usual minutes between readings
+        self.bins = time_bins(pd.Series(timestamps))
+        self.months = np.unique(self.bins // WEEK_SLOTS) + 1
+        self.rollups = Rollups()
+        self.rollups.add(self.timestamps, self.hours(), self.generation, self.house)
+        self.max_areas = max_areas
+        self._energy = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self):
+        """ Memory held for the readings and time features, in bytes. """
+        return self.timestamps.nbytes + self.generation.nbytes + self.house.nbytes + self.bins.nbytes
+
+    # profiles are built in worker processes for multiple sites, locks can't be pickled, and timestamps
+    # mapped from a store are mapped again rather than copied into the receiving process
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        if self.store is not None:
+            del state['timestamps']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        if self.store is not None:
+            self.timestamps = pd.DatetimeIndex(self.store.arrays(len(self.generation))["Timestamp"], copy=False)
+
+    # hours each reading stands for, computed when needed rather than held
+    def hours(self):
+        return interval_hours(self.timestamps, self.interval)
+
+    def power(self, area, rows=slice(None)):
+        """ Solar consumed, solar exported and grid consumed (kW) in each interval for a panel area. """
+        return interval_power(self.generation[rows], self.house[rows], area)
+
+    def energy(self, area):
+        """ kWh of solar consumed, solar exported and grid consumed per (month, slot of the week), as 12 x WEEK_SLOTS arrays. """
+        with self._lock:
+            if area in self._energy:
+                self._energy.move_to_end(area)
+                return self._energy[area]
+        totals = binned_energy(self.generation, self.house, self.hours(), self.bins, area)
+        with self._lock:
+            self._energy[area] = totals
+            if len(self._energy) > self.max_areas:
+                self._energy.popitem(last=False)
+        return totals
+
+    def rows(self, start_date, end_date, window=None):
+        """ Slice of the intervals between two dates, same semantics as slicing a frame indexed by timestamp.
+        window is an optional (start, end) pair of timestamps, e.g. a zoomed chart, that narrows the slice further.
+        """
+        start, stop, _ = self.timestamps.slice_indexer(start_date, end_date).indices(len(self.timestamps))
+        if window is not None:
+            start = max(start, self.timestamps.searchsorted(window[0]))
+            stop = min(stop, self.timestamps.searchsorted(window[1], side='right'))
+        return slice(start, max(start, stop))
+
+    def readings(self, start_date, end_date, window=None, max_rows=settings.ROLLUP_RAW_ROWS):
+        """ Timestamps, generation (W/m2) and house consumption (kW) between two dates. Ranges with more than
+        max_rows readings come from the finest rollup level with at most max_rows buckets, as averages per bucket.
+        """
+        rows = self.rows(start_date, end_date, window)
+        if rows.stop - rows.start <= max_rows:
+            return self.timestamps[rows], self.generation[rows], self.house[rows]
+        rollup, buckets = self.rollups.level(self.timestamps[rows.start], self.timestamps[rows.stop - 1], max_rows)
+        return rollup.means(buckets)
+
+    def series(self, area, start_date, end_date, window=None):
+        """ Frame of Timestamp and kW consumed/exported/from grid for the intervals between two dates,
+        averaged per hour, day or month for wide ranges (see readings).
+        """
+        timestamps, generation, house = self.readings(start_date, end_date, window)
+        consumed, exported, grid = interval_power(generation, house, area)
+        return pd.DataFrame({"Timestamp": timestamps,
+                             "SolarConsumed(kW)": consumed,
+                             "SolarExported(kW)": exported,
+                             "GridConsumed(kW)": grid})
+
+
+# one bin per (month, slot of the week) for each timestamp in a Series
+def time_bins(timestamps):
+    return (timestamps.dt.month.to_numpy(dtype=BIN_DTYPE) - 1) * WEEK_SLOTS + slot_index(timestamps)
+
+
+# solar consumed, solar exported and grid consumed (kW) in each interval, from the generation (W/m2) and house (kW) readings
+def interval_power(generation, house, area):
+    generation = generation * area / 1000  # generation from installed panels (hypothetical m2)
+    consumed = np.minimum(house, generation)
+    exported = np.clip(generation - house, 0, None)
+    grid = np.clip(house - generation, 0, None)
+    return consumed, exported, grid
+
+
+def binned_energy(generation, house, hours, bins, area):
+    """ kWh consumed, exported and from the grid per (month, slot of the week), as 12 x WEEK_SLOTS arrays, each
+    reading counting for its hours. Intervals with a missing reading add nothing, as they drop out of the bill
+    reduction in runcalcs.
+    """
+    return tuple(np.bincount(bins, weights=np.nan_to_num(kw) * hours, minlength=12 * WEEK_SLOTS).reshape(12, WEEK_SLOTS)
+                 for kw in interval_power(generation, house, area))
+
+
+@timed('scenario')
+def evaluate_scenario(profile, area, plan):
+    """ Monthly bill reduction ($), monthly kWh by source and annual savings for a panel area and a compiled tariff plan. """
+    return plan_scenario(profile.energy(area), profile.months, plan)
+
+
+@timed('scenario')
+def evaluate_plans(profile, area, plans):
+    """ Scenarios of several compiled tariff plans for a panel area, e.g. to compare retailers. The sensor data
+    is only gone through once (or not at all if the area's totals are cached), each plan is then a gather.
+    """
+    energy = profile.energy(area)
+    return [plan_scenario(energy, profile.months, plan) for plan in plans]
+
+
+# scenario from the kWh per (month, slot of the week) of each source, for the months (1-12) that have sensor data
+def plan_scenario(energy, months, plan):
+    consumed, exported, grid = energy
+    months = np.asarray(months)
+    index = months - 1
+    bill_reduction = ((consumed * slot_prices(plan)).sum(axis=1) + exported.sum(axis=1) * plan.feedin) / 100
+    return Scenario(months=months,
+                    bill_reduction=bill_reduction[index],
+                    solar_consumed=consumed.sum(axis=1)[index],
+                    solar_exported=exported.sum(axis=1)[index],
+                    grid_consumed=grid.sum(axis=1)[index],
+                    savings=bill_reduction.sum())
+
+
+# years and months for the panels to pay for themselves
+def payback_period(scenario, area, panelcost):
+    payback = area * panelcost / scenario.savings
+    years, months = divmod(payback, 1)
+    return years, months * 12
@@ -1,11 +1,55 @@
 # Global variables
+import os
 from datetime import datetime as dt
 
 SENSOR_RANGE = 'real_data!A1:D'
 TEST_RANGE = 'test_data!A1:C'
 
+# names used in the app for the sheet headers, and the type of each column once parsed
+COLUMN_NAMES = {'Solar power generated (W)': 'Solar(W)',
+                'Household consumption (kW)': 'House(kW)'}
+SENSOR_SCHEMA = {'Timestamp': 'datetime',
+                 'Solar(W)': 'float64',
+                 'House(kW)': 'float64'}
+TIMESTAMP_FORMAT = '%d/%m/%Y %H:%M:%S'
+
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
 SPREADSHEET_ID = '1hgnyrI9G6eB5pcBvBAaubaRcMFuLoAR0iLC_-aotFrY' # manually set from Google Sheets
+TOKEN_PATH = 'token.pickle'
+CREDENTIALS_PATH = 'credentials.json'
+DISCOVERY_PATH = 'sheets_discovery.json'  # local copy of the Sheets API discovery document, saved on first use
+
+# startup mode for servers and containers: serve the layout at once and load the sensor data in the background
+# (see app.py), retrying every LOAD_RETRY_SECONDS if it fails. The process should be serving within STARTUP_SECONDS
+# (checked by benchmark.py)
+FAST_START = os.environ.get('FAST_START', '0') == '1'
+LOAD_RETRY_SECONDS = 30
+STARTUP_SECONDS = 3
+# open a browser to sign in to google when there is no valid token - off with FAST_START so a missing token fails fast,
+# sign in once with python app.py beforehand
+INTERACTIVE_AUTH = os.environ.get('INTERACTIVE_AUTH', '0' if FAST_START else '1') == '1'
+
+# where sheet data comes from: 'google' for the Sheets API, 'local' for a JSON file standing in for it (offline tests/benchmarks)
+SHEETS_BACKEND = os.environ.get('SHEETS_BACKEND', 'google')
+LOCAL_SHEETS_PATH = os.environ.get('LOCAL_SHEETS_PATH', 'local_sheets.json')
+
+# sensor collector (see data_collection.py) - it writes to the sheet so needs its own token with write access
+COLLECTOR_SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+COLLECTOR_TOKEN_PATH = 'collector_token.pickle'
+COLLECTOR_LOG_PATH = 'collector.log'  # write-ahead log of readings not yet saved to the sheet
+collect_seconds = 5  # time between sensor readings
+flush_rows = 60  # readings sent to the sheet in one append...
+flush_seconds = 300  # ...or at least this often
+max_backoff_seconds = 900  # longest wait between retries when the sheet can't be reached
+
+# timings and counters on /metrics (see metrics.py), and writing a cProfile dump to PROFILE_PATH
+# for callbacks slower than PROFILE_SLOW_CALLBACKS seconds (None to never profile)
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+PROFILE_SLOW_CALLBACKS = float(os.environ['PROFILE_SLOW_CALLBACKS']) if os.environ.get('PROFILE_SLOW_CALLBACKS') else None
+PROFILE_PATH = 'profiles'
+
+# directory of the local copy of the sensor history (see store.py)
+STORE_PATH = os.environ.get('STORE_PATH', 'history')
 
 # frequency between checking google sheets/updating the dash
 wait_seconds = 5
@@ -13,6 +57,33 @@ wait_seconds = 5
 # number of points to plot on the live sensor data
 numlive = 100
 
+# most points sent to the browser per time series trace, about the width of a chart in pixels
+max_points = 1000
+
+# a gap in the sensor data is longer than this many usual intervals between readings, and isn't counted as generated/consumed
+gap_factor = 3
+
+# charts over date ranges with more readings than this are drawn from the hourly, daily or monthly rollups (see rollup.py)
+ROLLUP_RAW_ROWS = 50000
+
+# memory budget of the prepared sensor data (SolarProfile) per reading - it uses 18 bytes: 8 timestamp,
+# 4 + 4 float32 generation/consumption, 2 int16 (month, slot of the week) bin - or 20 bytes with an int32 bin
+# when TARIFF_SLOT_MINUTES is under 5
+PROFILE_BYTES_PER_ROW = 20
+
+# rows read and evaluated at a time when streaming a sensor history too big to load at once (see streaming.py)
+STREAM_CHUNK_ROWS = 50000
+
+# number of dashboard scenario results (area and tariffs) kept in memory
+SCENARIO_CACHE_SIZE = 128
+
+# grid of panel areas (m2) and panel costs ($/m2) for the payback surface, and the memory it may use (bytes)
+sweep_areas = list(range(1, 31))
+sweep_panelcosts = list(range(500, 3001, 100))
+SWEEP_MEMORY_BUDGET = 64 * 1024 * 1024
+# years the panels are expected to last, to weigh their savings against their cost when choosing an area
+panel_life = 25
+
 # Panel constants
 PanelW = 70  # panel width in mm
 PanelL = 55  # panel length in mm
@@ -29,3 +100,40 @@ default_peak = 54.8142
 
 default_startdate = dt(2018, 1, 29)
 default_enddate = dt(2018, 1, 31)
+
+# tariff plans (see tariffs.py) - rates in c/kWh, windows in hours of the day, and the minutes in each slot of the lookup
+TARIFF_SLOT_MINUTES = 60
+TARIFF_PLAN = {'name': 'Synergy time of use',
+               'rates': {'offpeak': default_offpeak, 'shoulder': default_shoulder, 'peak': default_peak},
+               'feedin': default_feedin,
+               'default': 'offpeak',  # before 7am and after 9pm
+               'windows': [{'days': 'weekday', 'start': 7, 'end': 15, 'rate': 'shoulder'},
+                           {'days': 'weekday', 'start': 15, 'end': 21, 'rate': 'peak'},
+                           {'days': 'weekend', 'start': 7, 'end': 21, 'rate': 'shoulder'}]}
+FLAT_RATE_PLAN = {'name': 'Flat rate',
+                  'rates': {'flat': 28.8229},
+                  'feedin': default_feedin,
+                  'default': 'flat'}
+# plans compared on the dashboard
+TARIFF_PLANS = [TARIFF_PLAN, FLAT_RATE_PLAN]
+
+# public holidays (WA), charged as weekends by the tariff plans
+PUBLIC_HOLIDAYS = [dt(2018, 1, 1), dt(2018, 1, 26), dt(2018, 3, 5), dt(2018, 3, 30), dt(2018, 4, 2), dt(2018, 4, 25),
+                   dt(2018, 6, 4), dt(2018, 9, 24), dt(2018, 12, 25), dt(2018, 12, 26),
+                   dt(2019, 1, 1), dt(2019, 1, 28), dt(2019, 3, 4), dt(2019, 4, 19), dt(2019, 4, 22), dt(2019, 4, 25),
+                   dt(2019, 6, 3), dt(2019, 9, 30), dt(2019, 12, 25), dt(2019, 12, 26)]
+
+# sensor installations, each with its own spreadsheet, ranges, panel size (mm) and tariff plan
+SITES = [
+    {'name': 'UWA test panel',
+     'spreadsheet_id': SPREADSHEET_ID,
+     'sensor_range': SENSOR_RANGE,
+     'history_range': TEST_RANGE,
+     'panel_w': PanelW,
+     'panel_l': PanelL,
+     'tariffs': TARIFF_PLAN},
+]
+
+# threads for fetching sites from google sheets, and processes for evaluating them (None = one per CPU)
+FETCH_WORKERS = 8
+COMPUTE_WORKERS = None
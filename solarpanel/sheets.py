@@ -0,0 +1,217 @@
+# clients for reading and appending to google sheets, created once and shared by the whole process
+import json
+import os.path
+import pickle
+import re
+import threading
+import settings
+
+
+# split an A1 range such as 'real_data!A1:D' into sheet name, first/last column and first/last row
+def split_range(SHEET_RANGE):
+    sheet, _, cells = SHEET_RANGE.rpartition('!')
+    match = re.match(r'^([A-Z]+)(\d*)(?::([A-Z]+)(\d*))?$', cells)
+    if match is None:
+        raise ValueError('Unsupported sheet range: {}'.format(SHEET_RANGE))
+    first_col, first_row, last_col, last_row = match.groups()
+    return (sheet,
+            first_col,
+            int(first_row) if first_row else 1,
+            last_col or first_col,
+            int(last_row) if last_row else None)
+
+
+# build a range over the same sheet/columns as SHEET_RANGE but covering different rows, e.g. 'real_data!A101:D'
+def sheet_range(SHEET_RANGE, first_row, last_row=None, columns=None):
+    sheet, first_col, _, last_col, _ = split_range(SHEET_RANGE)
+    if columns is not None:
+        first_col, last_col = columns
+    cells = '{}{}:{}{}'.format(first_col, first_row, last_col, '' if last_row is None else last_row)
+    return '{}!{}'.format(sheet, cells) if sheet else cells
+
+
+# convert a column letter to a 0-based index: A = 0, B = 1, ..., AA = 26
+def column_index(letters):
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+class GoogleSheetsClient:
+    """ Sheets API client that keeps its credentials and HTTP connections for the life of the process.
+    The token is only unpickled once and is only refreshed (and written back) when it has expired.
+    httplib2 is not thread safe, so each thread gets its own service on a kept-alive connection,
+    all built from one discovery document, which is kept in a local file so starting up doesn't fetch it.
+    """
+
+    def __init__(self, spreadsheet_id=settings.SPREADSHEET_ID, token_path=settings.TOKEN_PATH,
+                 credentials_path=settings.CREDENTIALS_PATH, scopes=settings.SCOPES):
+        self.spreadsheet_id = spreadsheet_id
+        self.token_path = token_path
+        self.credentials_path = credentials_path
+        self.scopes = scopes
+        self._creds = None
+        self._document = None
+        self._local = threading.local()
+        self._lock = threading.RLock()
+
+    def _credentials(self):
+        # The file token.pickle stores the user's access and refresh tokens, and is
+        # created automatically when the authorization flow completes for the first
+        # time.
+        if self._creds is None and os.path.exists(self.token_path):
+            with open(self.token_path, 'rb') as token:
+                self._creds = pickle.load(token)
+        if self._creds and self._creds.valid:
+            return self._creds
+        # If there are no (valid) credentials available, let the user log in.
+        if self._creds and self._creds.expired and self._creds.refresh_token:
+            from google.auth.transport.requests import Request
+            self._creds.refresh(Request())
+        elif not settings.INTERACTIVE_AUTH:
+            raise RuntimeError('No valid Google token in {}, sign in once with INTERACTIVE_AUTH=1'.format(self.token_path))
+        else:
+            from google_auth_oauthlib.flow import InstalledAppFlow
+            flow = InstalledAppFlow.from_client_secrets_file(self.credentials_path, self.scopes)
+            self._creds = flow.run_local_server(port=0)
+        # Save the credentials for the next run
+        with open(self.token_path, 'wb') as token:
+            pickle.dump(self._creds, token)
+        return self._creds
+
+    def _discovery_document(self, http):
+        """ The Sheets API discovery document from settings.DISCOVERY_PATH, or fetched and saved there for the next start. """
+        try:
+            with open(settings.DISCOVERY_PATH) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+        from googleapiclient.discovery import build
+        document = build('sheets', 'v4', http=http, cache_discovery=False)._rootDesc
+        try:
+            with open(settings.DISCOVERY_PATH + '.tmp', 'w') as f:
+                json.dump(document, f)
+            os.replace(settings.DISCOVERY_PATH + '.tmp', settings.DISCOVERY_PATH)
+        except OSError as error:
+            print('Could not save the Sheets API discovery document: {}'.format(error))
+        return document
+
+    def _spreadsheets(self):
+        import httplib2
+        from google_auth_httplib2 import AuthorizedHttp
+        from googleapiclient.discovery import build_from_document
+
+        with self._lock:
+            creds = self._credentials()
+            service = getattr(self._local, 'service', None)
+            if service is None:
+                http = AuthorizedHttp(creds, http=httplib2.Http())
+                if self._document is None:
+                    self._document = self._discovery_document(http)
+                service = build_from_document(self._document, http=http)
+                self._local.service = service
+        return service.spreadsheets()
+
+    def get(self, sheet_range, spreadsheet_id=None):
+        return self._spreadsheets().values().get(spreadsheetId=spreadsheet_id or self.spreadsheet_id,
+                                                 range=sheet_range).execute()
+
+    def batch_get(self, sheet_ranges, spreadsheet_id=None):
+        """ Reads several ranges in a single request, returns one result per range in the same order. """
+        result = self._spreadsheets().values().batchGet(spreadsheetId=spreadsheet_id or self.spreadsheet_id,
+                                                        ranges=list(sheet_ranges)).execute()
+        return result.get('valueRanges', [])
+
+    def append(self, sheet_range, rows, spreadsheet_id=None):
+        """ Appends rows after the last row of the table in sheet_range, in a single request.
+        Needs a token with the read/write spreadsheets scope.
+        """
+        return self._spreadsheets().values().append(spreadsheetId=spreadsheet_id or self.spreadsheet_id,
+                                                    range=sheet_range, valueInputOption='USER_ENTERED',
+                                                    insertDataOption='INSERT_ROWS', body={'values': rows}).execute()
+
+
+class LocalSheetsClient:
+    """ Stand-in for Google Sheets backed by a JSON file of {sheet name: rows} (or a dict of the same shape).
+    Sheets of other spreadsheets can be nested under their spreadsheet id: {spreadsheet id: {sheet name: rows}}.
+    Results have the same shape as the Sheets API, including dropping trailing empty cells and rows,
+    so the rest of the app can run offline for tests and benchmarks. The file is re-read when it changes.
+    """
+
+    def __init__(self, path=settings.LOCAL_SHEETS_PATH, sheets=None):
+        self.path = path
+        self._sheets = sheets
+        self._mtime = None
+        self._lock = threading.RLock()
+
+    def _load(self):
+        if self.path is not None and os.path.exists(self.path):
+            mtime = os.path.getmtime(self.path)
+            if mtime != self._mtime:
+                with open(self.path) as f:
+                    self._sheets = json.load(f)
+                self._mtime = mtime
+        if self._sheets is None:
+            self._sheets = {}
+        return self._sheets
+
+    def get(self, sheet_range, spreadsheet_id=None):
+        sheet, first_col, first_row, last_col, last_row = split_range(sheet_range)
+        first, last = column_index(first_col), column_index(last_col) + 1
+        with self._lock:
+            sheets = self._load()
+            sheets = sheets.get(spreadsheet_id, sheets) if spreadsheet_id else sheets
+            rows = sheets.get(sheet, [])[first_row - 1:last_row]
+        values = []
+        for row in rows:
+            cells = ['' if cell is None else str(cell) for cell in row[first:last]]
+            while cells and cells[-1] == '':
+                cells.pop()
+            values.append(cells)
+        while values and not values[-1]:
+            values.pop()
+        result = {'range': sheet_range, 'majorDimension': 'ROWS'}
+        if values:
+            result['values'] = values
+        return result
+
+    def batch_get(self, sheet_ranges, spreadsheet_id=None):
+        return [self.get(sheet_range, spreadsheet_id) for sheet_range in sheet_ranges]
+
+    def append(self, sheet_range, rows, spreadsheet_id=None):
+        sheet = split_range(sheet_range)[0]
+        with self._lock:
+            sheets = self._load()
+            sheets = sheets.setdefault(spreadsheet_id, {}) if spreadsheet_id else sheets
+            sheets.setdefault(sheet, []).extend([list(row) for row in rows])
+            if self.path is not None:
+                tmp = self.path + '.tmp'
+                with open(tmp, 'w') as f:
+                    json.dump(self._sheets, f)
+                os.replace(tmp, self.path)
+                self._mtime = os.path.getmtime(self.path)
+        return {'updates': {'updatedRange': sheet_range, 'updatedRows': len(rows)}}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_sheets_client():
+    """ Returns the process-wide sheets client, creating it on first use from settings.SHEETS_BACKEND. """
+    global _client
+    with _client_lock:
+        if _client is None:
+            if settings.SHEETS_BACKEND == 'local':
+                _client = LocalSheetsClient()
+            else:
+                _client = GoogleSheetsClient()
+        return _client
+
+
+def set_sheets_client(client):
+    """ Replaces the process-wide sheets client, e.g. with a LocalSheetsClient for offline runs. """
+    global _client
+    with _client_lock:
+        _client = client
@@ -0,0 +1,140 @@
+# registry of sensor installations, fetched concurrently and evaluated in parallel
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from solarpanel.data_processing import add_generation
+from solarpanel.metrics import timer
+from solarpanel.scenario import SolarProfile, evaluate_scenario
+from solarpanel.store import HistoryStore
+from solarpanel.tariffs import compile_plan
+import settings
+
+# one sensor installation - tariffs is the site's tariff plan dict (see tariffs.py)
+Site = namedtuple('Site', ['name', 'spreadsheet_id', 'sensor_range', 'history_range', 'panel_w', 'panel_l', 'tariffs'])
+
+
+def load_sites(sites=settings.SITES):
+    return [Site(**site) for site in sites]
+
+
+# panel area of the site's sensor in m2
+def panel_area(site):
+    return (site.panel_w / 1000) * (site.panel_l / 1000)
+
+
+# local history store of a site, one directory per site under settings.STORE_PATH
+def site_store(site):
+    return HistoryStore(os.path.join(settings.STORE_PATH, re.sub(r'\W+', '_', site.name)))
+
+
+def sync_site(site):
+    """ Syncs the site's local history with its sheet and returns its HistoryStore.
+    Falls back to the local copy when the sheet can't be reached.
+    """
+    store = site_store(site)
+    try:
+        store.sync(site.history_range, site.spreadsheet_id)
+    except Exception as error:
+        if not len(store):
+            raise
+        print('Could not sync {}, using the local copy: {}'.format(site.name, error))
+    return store
+
+
+# sync the site's local history and return its sensor frame, a copy of the history in this process
+def fetch_site(site):
+    return add_generation(sync_site(site).load(), panel_area(site))
+
+
+def fetch_sites(sites, max_workers=settings.FETCH_WORKERS, fetch=fetch_site):
+    """ Fetches every site with a bounded pool of threads (the time is spent waiting on the Sheets API),
+    returns {site name: sensor frame}, or {site name: HistoryStore} with fetch=sync_site.
+    Sites that fail with no local copy are left out.
+    """
+    frames = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [(site, pool.submit(fetch, site)) for site in sites]
+        for site, future in futures:
+            try:
+                frames[site.name] = future.result()
+            except Exception as error:
+                print('Could not load {}: {}'.format(site.name, error))
+    if sites and not frames:
+        raise RuntimeError('Could not load any sites')
+    return frames
+
+
+def build_profiles(frames, max_workers=settings.COMPUTE_WORKERS):
+    """ Prepares a SolarProfile for every site in a pool of processes, returns {site name: profile}. """
+    if len(frames) < 2:
+        return {name: SolarProfile(df) for name, df in frames.items()}
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return dict(zip(frames, pool.map(SolarProfile, frames.values())))
+
+
+def load_profiles(sites, max_workers=settings.COMPUTE_WORKERS):
+    """ Syncs every site and prepares its SolarProfile straight from its memory-mapped local history
+    (see SolarProfile.from_store), without loading the history into a frame. Returns {site name: profile}.
+    """
+    stores = fetch_sites(sites, fetch=sync_site)
+    areas = [panel_area(site) for site in sites if site.name in stores]
+    if len(stores) < 2:
+        return {name: SolarProfile.from_store(store, area) for (name, store), area in zip(stores.items(), areas)}
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return dict(zip(stores, pool.map(SolarProfile.from_store, stores.values(), areas)))
+
+
+# evaluate one site at a panel area with the site's own tariff plan
+def evaluate_site(profile, site, area):
+    return evaluate_scenario(profile, area, compile_plan(site.tariffs))
+
+
+def evaluate_sites(profiles, sites, area):
+    """ Evaluates every site that has a profile at a panel area with its own tariffs, returns {site name: Scenario}. """
+    return {site.name: evaluate_site(profiles[site.name], site, area) for site in sites if site.name in profiles}
+
+
+class SiteLoader:
+    """ Syncs the sites and builds their profiles in a background thread, so the dashboard can be served while
+    the sensor history syncs with google sheets. profiles is filled in and ready is set once loaded.
+    Like LivePoller it starts on first use in each process, and a failed load is retried after retry_seconds.
+    """
+
+    def __init__(self, sites, retry_seconds=settings.LOAD_RETRY_SECONDS):
+        self.sites = sites
+        self.retry_seconds = retry_seconds
+        self.profiles = {}
+        self.ready = threading.Event()
+        self.error = None
+        self._failed_at = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_running(self):
+        if self.ready.is_set():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._failed_at is not None and time.monotonic() - self._failed_at < self.retry_seconds:
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='site-loader', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        try:
+            with timer('site_load'):
+                profiles = load_profiles(self.sites)
+        except Exception as error:
+            print('Could not load the sites: {}'.format(error))
+            self.error = error
+            self._failed_at = time.monotonic()
+            return
+        self.profiles.update(profiles)
+        self.error = None
+        self.ready.set()
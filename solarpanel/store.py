@@ -0,0 +1,118 @@
+# local copy of the parsed sensor history, so the dashboard doesn't have to download it from google sheets on every start
+import json
+import os
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from solarpanel.data_processing import get_google_batch, get_google_data, parse_sheet
+from solarpanel.sheets import sheet_range
+import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows, where the dashboard runs as a single process
+    fcntl = None
+
+
+class HistoryStore:
+    """ Append-only columnar store of the typed sensor history.
+    Each column is a flat binary file of fixed dtype (timestamps as int64 nanoseconds) that is
+    opened with np.memmap, so mapping the columns (see arrays) doesn't copy them and every process
+    reading them shares the same pages from the OS cache. meta.json records the columns, the number of
+    rows and the last sheet row synced, and is replaced atomically after each append.
+    Processes syncing the same store (e.g. dashboard workers) take turns through a lock file, so each
+    sheet row is only downloaded by the first of them.
+    """
+
+    def __init__(self, path=settings.STORE_PATH, schema=settings.SENSOR_SCHEMA):
+        self.path = path
+        self.schema = schema
+
+    def _file(self, name):
+        return os.path.join(self.path, '{}.bin'.format(list(self.schema).index(name)))
+
+    def _dtype(self, name):
+        return np.dtype('int64' if self.schema[name] == 'datetime' else self.schema[name])
+
+    def meta(self):
+        try:
+            with open(os.path.join(self.path, 'meta.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'columns': list(self.schema), 'rows': 0, 'sheet_rows': 0}
+
+    def _write_meta(self, meta):
+        tmp = os.path.join(self.path, 'meta.json.{}.tmp'.format(os.getpid()))
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(self.path, 'meta.json'))
+
+    def __len__(self):
+        return self.meta()['rows']
+
+    def arrays(self, rows=None):
+        """ Returns read-only memory-mapped arrays for each column (of the first rows only if given),
+        without copying them into memory.
+        """
+        rows = len(self) if rows is None else rows
+        arrays = {}
+        for name in self.schema:
+            if rows:
+                values = np.memmap(self._file(name), dtype=self._dtype(name), mode='r', shape=(rows,))
+            else:
+                values = np.empty(0, dtype=self._dtype(name))
+            arrays[name] = values.view('datetime64[ns]') if self.schema[name] == 'datetime' else values
+        return arrays
+
+    def load(self):
+        """ Returns the stored history as a typed data frame. The frame is a copy of the mapped columns in this
+        process's memory, use arrays (e.g. SolarProfile.from_store) to share them instead.
+        """
+        return pd.DataFrame(self.arrays(), copy=False)
+
+    def append(self, df, sheet_rows):
+        """ Appends the rows of a typed frame and records sheet_rows as the last sheet row synced. """
+        os.makedirs(self.path, exist_ok=True)
+        meta = self.meta()
+        for name in self.schema:
+            if self.schema[name] == 'datetime':
+                values = df[name].to_numpy(dtype='datetime64[ns]').view('int64')
+            else:
+                values = df[name].to_numpy(dtype=self._dtype(name))
+            with open(self._file(name), 'ab') as f:
+                # drop anything written after the last complete append, e.g. if a previous sync was interrupted
+                f.truncate(meta['rows'] * values.itemsize)
+                f.write(values.tobytes())
+        meta.update(rows=meta['rows'] + len(df), sheet_rows=sheet_rows)
+        self._write_meta(meta)
+
+    @contextmanager
+    def _locked(self):
+        # exclusive lock on the store's lock file, released when the file is closed
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, 'sync.lock'), 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            yield
+
+    def sync(self, SHEET_RANGE, spreadsheet_id=None):
+        """ Downloads only the sheet rows added since the last sync and appends them, returns the number of new rows.
+        Waits for any other process syncing the store, then picks up from the rows it added.
+        """
+        with self._locked():
+            return self._sync(SHEET_RANGE, spreadsheet_id)
+
+    def _sync(self, SHEET_RANGE, spreadsheet_id):
+        synced = self.meta()['sheet_rows']
+        if synced == 0:
+            values = get_google_data(SHEET_RANGE, spreadsheet_id).get('values', [])
+            header, rows = values[:1], values[1:]
+        else:
+            header, tail = get_google_batch([sheet_range(SHEET_RANGE, 1, 1), sheet_range(SHEET_RANGE, synced + 1)],
+                                            spreadsheet_id)
+            header, rows = header.get('values', []), tail.get('values', [])
+        if not header or not rows:
+            return 0
+        df = parse_sheet({'values': header + rows})
+        self.append(df, max(synced, 1) + len(rows))
+        return len(df)
@@ -0,0 +1,113 @@
+# evaluate sensor histories too big to load at once, a chunk of rows at a time
+import numpy as np
+import pandas as pd
+from solarpanel.data_processing import add_generation, get_google_data, interval_hours, load_sensor_frame, nominal_interval
+from solarpanel.metrics import timed
+from solarpanel.rollup import Rollups
+from solarpanel.scenario import binned_energy, plan_scenario, time_bins
+from solarpanel.sheets import sheet_range
+from solarpanel.tariffs import WEEK_SLOTS
+import settings
+
+
+def sheet_chunks(SHEET_RANGE, chunk_rows=settings.STREAM_CHUNK_ROWS, spreadsheet_id=None, panel_area=settings.PanelA):
+    """ Sensor frames of up to chunk_rows sheet rows each, in sheet order, one Sheets API request per chunk.
+    Stops at the first chunk with no rows, so a run of chunk_rows blank rows ends the history.
+    """
+    header = get_google_data(sheet_range(SHEET_RANGE, 1, 1), spreadsheet_id).get('values', [])
+    if not header:
+        return
+    first = 2
+    while True:
+        rows = get_google_data(sheet_range(SHEET_RANGE, first, first + chunk_rows - 1), spreadsheet_id).get('values', [])
+        if not rows:
+            return
+        yield load_sensor_frame({'values': header + rows}, panel_area)
+        first += chunk_rows
+
+
+def store_chunks(store, chunk_rows=settings.STREAM_CHUNK_ROWS, panel_area=settings.PanelA):
+    """ Sensor frames of up to chunk_rows rows each from a HistoryStore. Only the rows of the current
+    chunk are copied out of the memory-mapped files.
+    """
+    arrays = store.arrays()
+    for start in range(0, len(store), chunk_rows):
+        yield add_generation(pd.DataFrame({name: values[start:start + chunk_rows] for name, values in arrays.items()}),
+                             panel_area)
+
+
+class StreamTotals:
+    """ Running kWh consumed, exported and from the grid per (year, month, slot of the week), and hourly, daily
+    and monthly rollups of the readings, folded in one sensor frame at a time. Chunks have to be in time order,
+    as a sheet or store is appended. Each reading counts for the time until the next one, so the last reading
+    of a chunk is held back until the next chunk arrives. Uses the same calculations as SolarProfile, so the
+    results match evaluating the whole history in memory when the usual interval between readings (the median
+    of the first chunk here, of all of them there) is the same.
+    """
+
+    def __init__(self):
+        self.years = {}  # year -> (consumed, exported, grid) 12 x WEEK_SLOTS kWh and 12 reading counts
+        self.rollups = Rollups()
+        self.interval = None  # usual minutes between readings
+        self._held = None  # last reading so far, waiting for the timestamp of the next one
+
+    def add(self, df, area):
+        df = df[df["Timestamp"].notna()]
+        if self._held is not None:
+            df = pd.concat([self._held, df], ignore_index=True)
+        if len(df) < 2:
+            self._held = df if len(df) else None
+            return
+        if self.interval is None:
+            self.interval = nominal_interval(df["Timestamp"])
+        self._held = df.iloc[-1:]
+        self._fold(df.iloc[:-1], interval_hours(df["Timestamp"], self.interval)[:-1], area)
+
+    def finish(self, area):
+        """ Folds in the last reading, which counts for the usual interval. """
+        if self._held is not None and self.interval is not None:
+            self._fold(self._held, interval_hours(self._held["Timestamp"], self.interval), area)
+        self._held = None
+
+    def _fold(self, df, hours, area):
+        timestamps = df["Timestamp"]
+        generation = df["Generation(W/m2)"].to_numpy(dtype='float32')
+        house = df["House(kW)"].to_numpy(dtype='float32')
+        self.rollups.add(timestamps, hours, generation, house)
+        bins = time_bins(timestamps)
+        year = timestamps.dt.year.to_numpy()
+        # usually one year per chunk, at most two
+        for y in np.unique(year).tolist():
+            rows = year == y if year[0] != year[-1] else slice(None)
+            energy = binned_energy(generation[rows], house[rows], hours[rows], bins[rows], area)
+            counts = np.bincount(bins[rows] // WEEK_SLOTS, minlength=12)
+            if y in self.years:
+                energy = tuple(total + kwh for total, kwh in zip(self.years[y][0], energy))
+                counts = counts + self.years[y][1]
+            self.years[y] = energy, counts
+
+    def energy(self, year=None):
+        """ kWh per (month, slot of the week) of each source, as 12 x WEEK_SLOTS arrays, for one year or all of them,
+        and the months (1-12) that have sensor data.
+        """
+        years = [self.years[year]] if year is not None else list(self.years.values())
+        energy = tuple(sum(kwh[i] for kwh, _ in years) for i in range(3))
+        counts = sum(count for _, count in years)
+        return energy, np.flatnonzero(counts) + 1
+
+
+@timed('stream')
+def evaluate_stream(chunks, area, plan):
+    """ Evaluates a panel area and compiled tariff plan over sensor frames a chunk at a time, so memory is bounded
+    by the chunk size rather than the length of the history.
+    Returns the Scenario of the whole history, the same as evaluate_scenario of a SolarProfile of it,
+    and {year: Scenario} of each year.
+    """
+    totals = StreamTotals()
+    for df in chunks:
+        totals.add(df, area)
+    totals.finish(area)
+    if totals.interval is None:
+        raise ValueError('Need at least two readings to evaluate')
+    return (plan_scenario(*totals.energy(), plan),
+            {year: plan_scenario(*totals.energy(year), plan) for year in sorted(totals.years)})
@@ -0,0 +1,54 @@
+# evaluate many combinations of panel area, panel cost and tariffs against the same sensor data in one go
+from collections import namedtuple
+import numpy as np
+from solarpanel.data_processing import interval_hours
+from solarpanel.metrics import timed
+from solarpanel.tariffs import WEEK_SLOTS
+import settings
+
+# savings is ($/year) per (area, tariff plan), payback is (years) per (area, tariff plan, panel cost)
+Sweep = namedtuple('Sweep', ['areas', 'panelcosts', 'plans', 'savings', 'payback'])
+
+
+@timed('sweep')
+def sweep_scenarios(profile, areas, panelcosts, plans, memory_budget=settings.SWEEP_MEMORY_BUDGET):
+    """ Annual savings and payback for every combination of panel area, panel cost and compiled tariff plan.
+    Uses the same model as runcalcs, but panel areas are broadcast over the readings and each plan's prices
+    are gathered for the readings, so the savings of every (area, plan) are matrix products. The readings are
+    gone through a chunk at a time so the (areas + plans) x readings temporaries stay within memory_budget bytes.
+    """
+    areas = np.asarray(areas, dtype=float)
+    panelcosts = np.asarray(panelcosts, dtype=float)
+
+    timestamps, house = profile.timestamps, profile.house
+    rows = len(house)
+    savings = np.zeros((len(areas), len(plans)))  # c per (area, plan)
+    # per reading about four float64 values per area and six per plan are alive at once
+    chunk = max(1, int(memory_budget // (8 * (4 * len(areas) + 6 * len(plans) + 4))))
+    for start in range(0, rows, chunk):
+        stop = min(start + chunk, rows)
+        # kW to kWh for each reading, the last one of the chunk counting until the first of the next
+        hours = interval_hours(timestamps[start:stop], profile.interval, timestamps[stop] if stop < rows else None)[:, None]
+        # c/kW of every reading under each plan, from the plan's (month, slot of the week) prices, times the hours it stands for
+        month, slot = np.divmod(profile.bins[start:stop], WEEK_SLOTS)
+        prices = np.stack([plan.prices[month, plan.slots[slot]] for plan in plans], axis=1) * hours
+        feedin = np.stack([plan.feedin[month] for plan in plans], axis=1) * hours
+        generation = profile.generation[start:stop] * areas[:, None] / 1000
+        demand = house[start:stop]
+        savings += np.nan_to_num(np.minimum(demand, generation)) @ prices
+        savings += np.nan_to_num(np.clip(generation - demand, 0, None)) @ feedin
+        del generation, prices, feedin
+
+    savings /= 100
+    payback = areas[:, None, None] * panelcosts[None, None, :] / savings[:, :, None]
+    return Sweep(areas=areas, panelcosts=panelcosts, plans=plans, savings=savings, payback=payback)
+
+
+def optimal_area(sweep, panelcost, life=settings.panel_life):
+    """ Area with the largest net saving ($) over the panels' life (years), i.e. savings less the cost of the
+    panels, for each tariff plan at a panel cost ($/m2), and that net saving. Payback alone isn't used as it
+    doesn't depend on the panel cost and, with savings about linear in area, always picks an end of the grid.
+    """
+    net = life * sweep.savings - sweep.areas[:, None] * panelcost
+    best = np.nanargmax(net, axis=0)
+    return sweep.areas[best], net[best, np.arange(net.shape[1])]
@@ -0,0 +1,43 @@
+# synthetic sensor data shaped like the google sheets API returns it, for offline benchmarks and testing
+import json
+from datetime import datetime as dt
+import numpy as np
+import pandas as pd
+import settings
+
+
+def synthetic_rows(days=30, interval_minutes=1, start=dt(2018, 1, 1), noise=0.1, ragged=0.01, seed=0):
+    """ Rows of a test_data style sheet: a header, then Timestamp, Solar power generated (W) and
+    Household consumption (kW) as text every interval_minutes for the given number of days.
+    Solar follows a daylight curve with passing cloud, the house has morning and evening peaks, both
+    with relative noise. A fraction ragged of the rows have their last cell missing, as the API
+    drops trailing empty cells.
+    """
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range(start, periods=int(days * 24 * 60 / interval_minutes), freq='{}min'.format(interval_minutes))
+    n = len(timestamps)
+    hour = timestamps.hour.to_numpy() + timestamps.minute.to_numpy() / 60
+
+    daylight = np.clip(np.sin((hour - 6) / 12 * np.pi), 0, None)
+    season = 1 + 0.3 * np.cos((timestamps.dayofyear.to_numpy() - 15) / 365 * 2 * np.pi)  # southern hemisphere summer
+    cloud = np.clip(1 - np.abs(np.cumsum(rng.normal(0, 0.02, n))) % 1, 0.2, 1)
+    solar = 0.8 * daylight * season * cloud * (1 + rng.normal(0, noise, n))
+    house = (0.3 + 1.2 * np.exp(-((hour - 7.5) / 1.5) ** 2) + 2.0 * np.exp(-((hour - 19) / 2) ** 2)) * (1 + rng.normal(0, noise, n))
+
+    rows = np.column_stack([timestamps.strftime(settings.TIMESTAMP_FORMAT).to_numpy(dtype=str),
+                            np.char.mod('%.4f', np.clip(solar, 0, None)),
+                            np.char.mod('%.4f', np.clip(house, 0, None))]).tolist()
+    for i in np.flatnonzero(rng.random(n) < ragged):
+        rows[i] = rows[i][:-1]
+    return [['Timestamp', 'Solar power generated (W)', 'Household consumption (kW)']] + rows
+
+
+def synthetic_sheets(days=30, interval_minutes=1, **kwargs):
+    """ Sheets for a LocalSheetsClient, with the same synthetic rows as the history and the live sensor data. """
+    rows = synthetic_rows(days, interval_minutes, **kwargs)
+    return {'test_data': rows, 'real_data': rows}
+
+
+def write_local_sheets(path=settings.LOCAL_SHEETS_PATH, days=30, interval_minutes=1, **kwargs):
+    with open(path, 'w') as f:
+        json.dump(synthetic_sheets(days, interval_minutes, **kwargs), f)
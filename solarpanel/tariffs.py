@@ -0,0 +1,75 @@
+# time of use tariff plans, written as dicts (see settings.TARIFF_PLANS) and compiled to a lookup of the rate in each slot of the week
+from collections import namedtuple
+import numpy as np
+import settings
+
+# day types: Monday = 0 ... Sunday = 6, and public holidays (settings.PUBLIC_HOLIDAYS) whatever day they fall on
+HOLIDAY = 7
+DAYS = {'weekday': (0, 1, 2, 3, 4),
+        'weekend': (5, 6, HOLIDAY),  # public holidays are charged as weekends unless a plan has its own 'holiday' windows
+        'holiday': (HOLIDAY,),
+        'all': tuple(range(HOLIDAY + 1))}
+SLOTS_PER_DAY = 24 * 60 // settings.TARIFF_SLOT_MINUTES
+WEEK_SLOTS = (HOLIDAY + 1) * SLOTS_PER_DAY
+# smallest integer dtype holding every (month, slot of the week) bin, int32 for slots shorter than 5 minutes
+BIN_DTYPE = np.dtype('int16' if 12 * WEEK_SLOTS <= np.iinfo('int16').max + 1 else 'int32')
+
+# a compiled plan - slots is the index into rate_names of the rate charged in each slot of the week (WEEK_SLOTS),
+# prices (c/kWh) is 12 months x rates and feedin (c/kWh) has one rate per month
+TariffPlan = namedtuple('TariffPlan', ['name', 'rate_names', 'slots', 'prices', 'feedin'])
+
+
+def _slot(hour):
+    minutes = hour * 60
+    if minutes % settings.TARIFF_SLOT_MINUTES:
+        raise ValueError('Tariff window boundary {}h is not a multiple of {} minutes'.format(hour, settings.TARIFF_SLOT_MINUTES))
+    return int(minutes // settings.TARIFF_SLOT_MINUTES)
+
+
+def compile_plan(plan):
+    """ Compiles a tariff plan dict to a TariffPlan:
+    name, rates {rate name: c/kWh}, feedin (c/kWh), default (the rate name outside every window),
+    windows - a list of {'days': 'weekday'/'weekend'/'holiday'/'all' or a list of day numbers,
+    'start': hour, 'end': hour, 'rate': rate name}, where later windows override earlier ones and
+    start > end wraps past midnight,
+    seasons (optional) - a list of {'months': [1-12, ...], 'rates': {rate name: c/kWh}, 'feedin': c/kWh}
+    overriding the rates of those months.
+    """
+    rate_names = list(plan['rates'])
+    day_slots = np.full((HOLIDAY + 1, SLOTS_PER_DAY), rate_names.index(plan['default']), dtype='int8')
+    for window in plan.get('windows', []):
+        days = DAYS[window['days']] if isinstance(window['days'], str) else window['days']
+        start, end = _slot(window['start']), _slot(window['end'])
+        hours = np.arange(start, end) if start <= end else np.r_[start:SLOTS_PER_DAY, 0:end]
+        day_slots[np.ix_(days, hours)] = rate_names.index(window['rate'])
+
+    prices = np.tile(np.array([plan['rates'][name] for name in rate_names], dtype=float), (12, 1))
+    feedin = np.full(12, plan['feedin'], dtype=float)
+    for season in plan.get('seasons', []):
+        months = np.asarray(season['months']) - 1
+        for name, rate in season.get('rates', {}).items():
+            prices[months, rate_names.index(name)] = rate
+        if 'feedin' in season:
+            feedin[months] = season['feedin']
+    return TariffPlan(name=plan['name'], rate_names=rate_names, slots=day_slots.ravel(), prices=prices, feedin=feedin)
+
+
+def with_rates(plan, feedin, **rates):
+    """ Copy of a tariff plan dict with its feed in and base rates replaced, e.g. from the dashboard inputs.
+    Rates the plan doesn't have are ignored, seasonal rates are kept.
+    """
+    return dict(plan, feedin=feedin, rates={name: rates.get(name, rate) for name, rate in plan['rates'].items()})
+
+
+def slot_index(timestamps, holidays=settings.PUBLIC_HOLIDAYS):
+    """ Slot of the week (0 to WEEK_SLOTS - 1) of each timestamp in a Series, public holidays have their own day. """
+    day = timestamps.dt.dayofweek.to_numpy()
+    if holidays:
+        day = np.where(timestamps.dt.normalize().isin(holidays).to_numpy(), HOLIDAY, day)
+    minutes = timestamps.dt.hour.to_numpy() * 60 + timestamps.dt.minute.to_numpy()
+    return (day * SLOTS_PER_DAY + minutes // settings.TARIFF_SLOT_MINUTES).astype(BIN_DTYPE)
+
+
+# c/kWh charged in each (month, slot of the week) - a 12 x WEEK_SLOTS array
+def slot_prices(plan):
+    return plan.prices[:, plan.slots]